@@ -0,0 +1,191 @@
+#Process-wide scheduler for outbound API calls (OpenAI, Adzuna) in CareerNodes.
+
+#Every call first waits for a slot from its provider's token buckets, one for requests per
+#minute and one for tokens per minute. Waiting calls are served interactive work first, then
+#round-robin across sessions within a priority, so one session's burst of requests can't
+#starve the others. A rate-limit reply with a retry-after header pauses the whole provider
+#instead of letting every waiting call hit the same 429.
+
+#The calling session and priority travel in a context variable; submit_in_context carries
+#them onto executor threads.
+
+import contextvars
+import email.utils
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+INTERACTIVE, BACKGROUND = 0, 1
+
+_context = contextvars.ContextVar("api_scheduler_context", default=("default", INTERACTIVE))
+
+
+class TokenBucket:
+    # Refills continuously at per_minute / 60 per second, holding at most one minute's worth
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        # Requests larger than the bucket only need a full bucket, so they can't wait forever
+        self.refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        # May go below zero (see APIScheduler.settle); later calls wait for the refill
+        self.level -= amount
+
+
+class ProviderLimits:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+
+    def wait_time(self, tokens, now):
+        wait = max(0.0, self.paused_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def take(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+
+class APIScheduler:
+    # limits maps a provider name to (requests per minute, tokens per minute); 0 means
+    # unlimited. Calls to providers without limits go straight through.
+    def __init__(self, limits):
+        self.providers = {name: ProviderLimits(*provider_limits) for name, provider_limits in limits.items()}
+        self.condition = threading.Condition()
+        self.queues = {name: {} for name in limits}  # provider -> priority -> session -> tickets
+        self.granted = {name: 0 for name in limits}
+        self.waited_seconds = {name: 0.0 for name in limits}
+
+    def next_ticket(self, provider):
+        queues = self.queues[provider]
+        for priority in sorted(queues):
+            if queues[priority]:
+                return next(iter(queues[priority].values()))[0]
+        return None
+
+    def acquire(self, provider, tokens=0, session=None, priority=None):
+        # Blocks until the call may go out and returns the seconds spent waiting; tokens is
+        # the caller's estimate for the request
+        limits = self.providers.get(provider)
+        if limits is None:
+            return 0.0
+        default_session, default_priority = _context.get()
+        session = default_session if session is None else session
+        priority = default_priority if priority is None else priority
+        ticket = object()
+        started = time.monotonic()
+        with self.condition:
+            sessions = self.queues[provider].setdefault(priority, OrderedDict())
+            sessions.setdefault(session, deque()).append(ticket)
+            while True:
+                wait = None
+                if self.next_ticket(provider) is ticket:
+                    now = time.monotonic()
+                    wait = limits.wait_time(tokens, now)
+                    if wait <= 0:
+                        limits.take(tokens)
+                        break
+                self.condition.wait(wait)
+            # Served: the session goes to the back of its priority's round-robin
+            sessions[session].popleft()
+            if sessions[session]:
+                sessions.move_to_end(session)
+            else:
+                del sessions[session]
+            waited = time.monotonic() - started
+            self.granted[provider] += 1
+            self.waited_seconds[provider] += waited
+            self.condition.notify_all()
+        return waited
+
+    def settle(self, provider, estimated_tokens, actual_tokens):
+        # Charges (or refunds) the difference between a request's estimate and its usage
+        limits = self.providers.get(provider)
+        if limits is None or limits.tokens is None:
+            return
+        with self.condition:
+            limits.tokens.take(actual_tokens - estimated_tokens)
+            limits.tokens.level = min(limits.tokens.level, limits.tokens.capacity)
+            self.condition.notify_all()
+
+    def pause(self, provider, seconds):
+        limits = self.providers.get(provider)
+        if limits is None:
+            return
+        with self.condition:
+            limits.paused_until = max(limits.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            now = time.monotonic()
+            return {
+                name: {
+                    "queued": sum(len(tickets) for sessions in self.queues[name].values() for tickets in sessions.values()),
+                    "granted": self.granted[name],
+                    "average_wait_seconds": self.waited_seconds[name] / self.granted[name] if self.granted[name] else 0.0,
+                    "paused_seconds": max(0.0, limits.paused_until - now),
+                }
+                for name, limits in self.providers.items()
+            }
+
+
+def set_session(session):
+    # Tags the API calls made from the current thread (and anything it submits) with a session
+    _context.set((session, _context.get()[1]))
+
+
+@contextmanager
+def api_context(session=None, priority=None):
+    current_session, current_priority = _context.get()
+    token = _context.set((current_session if session is None else session, current_priority if priority is None else priority))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def submit_in_context(executor, func, *args, priority=None):
+    # executor.submit that keeps the caller's session, and its priority unless one is given
+    context = contextvars.copy_context()
+    if priority is not None:
+        context.run(lambda: _context.set((_context.get()[0], priority)))
+    return executor.submit(context.run, func, *args)
+
+
+def retry_after_seconds(headers):
+    # Seconds the server asked us to wait, from retry-after-ms or retry-after (seconds or an
+    # HTTP date); None when there is no usable header
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
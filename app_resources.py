@@ -0,0 +1,46 @@
+#Streamlit-cached resources and data for CareerNodes.py.
+
+#They live in a module, not in the script, because Streamlit runs the script top to bottom on
+#every rerun: a cached function defined there is wrapped again each time, and building the
+#wrapper re-reads and hashes the function's source. Defined here, each wrapper is built once
+#per process when the module is first imported.
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import streamlit as st
+
+import career_graph
+import resume_extraction
+
+RESUME_WORKERS = int(os.getenv("RESUME_WORKERS", min(4, os.cpu_count() or 1)))
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "careernodes.css")
+
+
+@st.cache_resource
+def load_stylesheet():
+    # Read once per process. Streamlit clears anything a rerun doesn't draw, so the <style>
+    # element itself is still sent on every run
+    with open(STYLESHEET_PATH) as f:
+        return f"<style>\n{f.read()}</style>"
+
+
+@st.cache_resource
+def get_resume_pool():
+    # Shared across sessions; PyPDF2 is pure Python, so pages are parsed in separate processes.
+    # Workers are spawned, not forked: a fork of the threaded server can copy a lock (import,
+    # logging) that another thread holds and deadlock the worker
+    return ProcessPoolExecutor(max_workers=RESUME_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def extract_resume_text_cached(name, data):
+    # st.cache_data hashes the file bytes, so identical uploads are only parsed once
+    return resume_extraction.extract_text(name, data, get_resume_pool(), RESUME_WORKERS)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_graph_html(nodes):
+    # st.cache_data keys on a hash of the result set, so an unchanged one reuses its HTML
+    return career_graph.build_graph_html(nodes)
@@ -0,0 +1,273 @@
+#Headless batch matching for CareerNodes: runs the Find Matches pipeline for a whole file of
+#profiles (e.g. a career-center cohort) without Streamlit.
+
+#Profiles come from a JSON list or a JSONL file. Each one is an object with the form's fields
+#(gpa, education, school, major, skills, location, industry, org_type, schedule, salary_min,
+#salary_max, start_date, end_date, work_type), an optional "id", and the resume as
+#"resume_text" or "resume_path" (PDF or TXT). Missing fields are left unspecified.
+
+#Listings are pooled once for the whole run: --json files, one Adzuna pull per distinct
+#(search queries, location) among the profiles, and the listing index when one is built.
+#Profiles are embedded in chunks and scored against every pooled listing with one matrix
+#product per chunk; the LLM stage for each profile then runs on a worker pool.
+
+#Output is JSONL, one line per profile, written as soon as that profile is done. The output
+#file doubles as the checkpoint: rerunning with the same --out skips profiles already in it.
+
+#python batch_matching.py profiles.jsonl --out matches.jsonl --json internships.json
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+import resume_extraction
+from api_scheduler import BACKGROUND, api_context, submit_in_context
+from careernodes_core import (
+    EXPLAIN_TOP_N, LLM_TOP_CANDIDATES, AdzunaError, build_embedding_text, build_search_queries,
+    create_user_profile_text, embed_texts, fetch_internships, match_candidates, normalize_listing, text_hash
+)
+from listing_dedup import canonical_indices, collapse_near_duplicates, duplicate_roots
+from listing_index import load_default_index, top_k
+from listing_rules import build_listing_table, evaluate_rules, score_listings
+
+BATCH_PROFILE_CHUNK = int(os.getenv("BATCH_PROFILE_CHUNK", 256))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
+
+# The values the form uses when a field is left empty
+PROFILE_DEFAULTS = {
+    "gpa": None, "education": "Choose an option", "school": "", "major": "",
+    "skills": [], "location": "", "industry": [], "org_type": [],
+    "schedule": "Choose an option", "salary_min": None, "salary_max": None,
+    "start_date": "No preferred date", "end_date": "No preferred date",
+    "work_type": "Choose an option"
+}
+
+
+def load_profiles(path):
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            profiles = [json.loads(line) for line in f if line.strip()]
+        else:
+            profiles = json.load(f)
+    for n, profile in enumerate(profiles):
+        profile["id"] = str(profile.get("id", n))
+    return profiles
+
+
+def profile_inputs(profile):
+    inputs = dict(PROFILE_DEFAULTS)
+    inputs.update({key: profile[key] for key in PROFILE_DEFAULTS if profile.get(key) is not None})
+    for key in ("skills", "industry", "org_type"):
+        if isinstance(inputs[key], str):
+            inputs[key] = [value.strip() for value in inputs[key].split(",") if value.strip()]
+    inputs["skills"] = [skill.lower() for skill in inputs["skills"]]
+    return inputs
+
+
+def profile_resume_text(profile):
+    if profile.get("resume_text"):
+        return profile["resume_text"]
+    if not profile.get("resume_path"):
+        return ""
+    with open(profile["resume_path"], "rb") as f:
+        return resume_extraction.extract_text(os.path.basename(profile["resume_path"]), f.read())
+
+
+def profile_text_for(profile, inputs):
+    return create_user_profile_text(inputs, profile_resume_text(profile))
+
+
+def fetch_key(inputs):
+    return json.dumps([build_search_queries(inputs["major"], inputs["skills"]), inputs["location"]])
+
+
+def read_checkpoint(out_path):
+    # Returns the profile ids already written. A line cut short by an interruption is
+    # dropped from the file so the run can append after the last complete line.
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "rb+") as f:
+        valid_end = 0
+        for line in iter(f.readline, b""):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(line)["profile_id"])
+            except (ValueError, KeyError):
+                break
+            valid_end += len(line)
+        f.truncate(valid_end)
+    return done
+
+
+class ListingPool:
+    # Every listing the run can match against, near-duplicates collapsed, with one embedding
+    # matrix and one rule table. groups[g] masks the columns fetched for fetch key g; listings
+    # from --json files are open to every profile.
+    def __init__(self, shared_listings, fetched):
+        listings = []
+        sources = []
+        seen = set()
+        for source, group_listings in [(None, shared_listings)] + list(fetched.items()):
+            for listing in group_listings:
+                listing["id"] = listing.get("id") or text_hash(build_embedding_text(listing))[:16]
+                if (source, listing["id"]) not in seen:
+                    seen.add((source, listing["id"]))
+                    listings.append(listing)
+                    sources.append(source)
+
+        roots = duplicate_roots(listings)
+        self.listings = collapse_near_duplicates(listings, roots=roots)
+        columns = {root: column for column, root in enumerate(sorted(set(roots)))}
+        self.groups = {key: np.zeros(len(self.listings), dtype=bool) for key in fetched}
+        shared = np.zeros(len(self.listings), dtype=bool)
+        for source, root in zip(sources, roots):
+            if source is None:
+                shared[columns[root]] = True
+            else:
+                self.groups[source][columns[root]] = True
+        for key in self.groups:
+            self.groups[key] |= shared
+        self.shared = shared
+
+        self.vectors = embed_texts([build_embedding_text(listing) for listing in self.listings])
+        self.table = build_listing_table(self.listings) if self.listings else None
+
+    def allowed(self, key, inputs):
+        # Columns this profile may be matched with: its own search results plus the shared
+        # listings, minus whatever the structured hard filters rule out
+        mask = self.groups.get(key, self.shared).copy()
+        if self.table is not None:
+            mask &= evaluate_rules(inputs, self.table)[0]
+        return mask
+
+
+def rank_profile_chunk(pool, index, profile_texts, inputs, keys, k=LLM_TOP_CANDIDATES):
+    # Embedding stage for a chunk of profiles: one embedding pass and one matrix product
+    # against the pool (plus one batched index search); returns [(similarity, listing)] per
+    # profile, best first
+    profile_vectors = embed_texts(profile_texts)
+    ranked = [[] for _ in profile_texts]
+    if len(pool.listings):
+        similarities = profile_vectors @ pool.vectors.T
+        for row, (key, profile_input) in enumerate(zip(keys, inputs)):
+            similarities[row, ~pool.allowed(key, profile_input)] = -np.inf
+        columns = np.broadcast_to(np.arange(len(pool.listings)), similarities.shape)
+        best_scores, best_columns = top_k(similarities, columns, min(k, len(pool.listings)))
+        for row in range(len(profile_texts)):
+            ranked[row] = [(float(score), pool.listings[column]) for score, column in zip(best_scores[row], best_columns[row]) if np.isfinite(score)]
+
+    if index is not None and len(index):
+        index_scores, index_ids = index.search(profile_vectors, k=k)
+        for row in range(len(profile_texts)):
+            hits = index_ids[row] >= 0  # Unfilled slots are padded with -1
+            index_listings = index.get_listings(index_ids[row][hits])
+            eligible = score_listings(inputs[row], index_listings)[0]
+            live_ids = {listing.get("id") for _, listing in ranked[row]}
+            merged = ranked[row] + [(float(score), listing) for score, listing, ok in zip(index_scores[row][hits], index_listings, eligible) if ok and listing.get("id") not in live_ids]
+            merged.sort(reverse=True, key=lambda x: x[0])
+            ranked[row] = [merged[n] for n in canonical_indices([listing for _, listing in merged])][:k]
+    return ranked
+
+
+def match_record(profile_id, results):
+    return {
+        "profile_id": profile_id,
+        "matches": [
+            {
+                "listing_id": listing.get("id"), "title": listing["title"], "company": listing["company"],
+                "location": listing["location"], "redirect_url": listing.get("redirect_url"),
+                "score": round(float(score), 4), "explanation": explanation
+            }
+            for score, listing, explanation in results
+        ]
+    }
+
+
+def iter_batch_matches(profiles, shared_listings=(), fetch=True, index=None, workers=BATCH_WORKERS, chunk_size=BATCH_PROFILE_CHUNK, explain_top=EXPLAIN_TOP_N):
+    # Yields one match record per profile, in completion order. Profiles that fail are
+    # reported on stderr and skipped, so a resumed run retries them.
+    inputs = [profile_inputs(profile) for profile in profiles]
+    keys = [fetch_key(profile_input) for profile_input in inputs]
+    fetched = {}
+    if fetch:
+        for key, profile_input in zip(keys, inputs):
+            if key in fetched:
+                continue
+            try:
+                jobs = fetch_internships(build_search_queries(profile_input["major"], profile_input["skills"]), profile_input["location"])
+            except AdzunaError as error:
+                print(f"Adzuna fetch failed for {key}: {error}", file=sys.stderr)
+                jobs = []
+            fetched[key] = [normalize_listing(job) for job in jobs]
+    pool = ListingPool([dict(listing) for listing in shared_listings], fetched)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for start in range(0, len(profiles), chunk_size):
+            # Profile text can mean a resume parse and summary, so it also runs on the pool
+            # A profile whose resume can't be read or summarized is dropped from the chunk
+            chunk = range(start, min(start + chunk_size, len(profiles)))
+            text_futures = {n: submit_in_context(executor, profile_text_for, profiles[n], inputs[n]) for n in chunk}
+            chunk = []
+            profile_texts = []
+            for n, future in text_futures.items():
+                try:
+                    profile_texts.append(future.result())
+                    chunk.append(n)
+                except Exception as error:
+                    print(f"Profile {profiles[n]['id']} failed: {error}", file=sys.stderr)
+            if not chunk:
+                continue
+            ranked = rank_profile_chunk(pool, index, profile_texts, [inputs[n] for n in chunk], [keys[n] for n in chunk])
+
+            futures = {
+                submit_in_context(executor, match_candidates, profile_text, candidates, inputs[n], explain_top): n
+                for n, profile_text, candidates in zip(chunk, profile_texts, ranked)
+            }
+            for future in as_completed(futures):
+                n = futures[future]
+                try:
+                    yield match_record(profiles[n]["id"], future.result())
+                except Exception as error:
+                    print(f"Profile {profiles[n]['id']} failed: {error}", file=sys.stderr)
+
+
+def run_batch(profiles_path, out_path, json_paths=(), fetch=True, use_index=True, workers=BATCH_WORKERS, chunk_size=BATCH_PROFILE_CHUNK, explain_top=EXPLAIN_TOP_N):
+    # Returns (profiles written this run, profiles skipped from the checkpoint)
+    done = read_checkpoint(out_path)
+    profiles = [profile for profile in load_profiles(profiles_path) if profile["id"] not in done]
+    shared_listings = []
+    for path in json_paths:
+        with open(path) as f:
+            shared_listings += [normalize_listing(record) for record in json.load(f)]
+    index = load_default_index() if use_index else None
+
+    written = 0
+    with api_context(session="batch", priority=BACKGROUND), open(out_path, "a") as out:
+        for record in iter_batch_matches(profiles, shared_listings, fetch, index, workers, chunk_size, explain_top):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            written += 1
+    return written, len(done)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match a file of profiles against internship listings.")
+    parser.add_argument("profiles", help="JSON list or JSONL file of profiles")
+    parser.add_argument("--out", default="matches.jsonl", help="JSONL output; also the resume checkpoint")
+    parser.add_argument("--json", action="append", default=[], help="internships.json-style file shared by every profile (repeatable)")
+    parser.add_argument("--no-fetch", action="store_true", help="don't pull listings from Adzuna")
+    parser.add_argument("--no-index", action="store_true", help="don't use the listing index")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--chunk", type=int, default=BATCH_PROFILE_CHUNK, help="profiles embedded and ranked per matrix product")
+    parser.add_argument("--explain-top", type=int, default=EXPLAIN_TOP_N, help="explanations written per profile")
+    args = parser.parse_args()
+    started = time.time()
+    written, skipped = run_batch(args.profiles, args.out, args.json, not args.no_fetch, not args.no_index, args.workers, args.chunk, args.explain_top)
+    print(f"Matched {written} profiles into {args.out} ({skipped} already done) in {time.time() - started:.1f}s")
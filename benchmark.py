@@ -0,0 +1,478 @@
+#Offline benchmarks for the CareerNodes pipeline.
+
+#OpenAI and Adzuna are replaced by in-process stand-ins (FakeOpenAI, FakeAdzunaSession) with
+#configurable latency and error rates. They serve canned payloads built from internships.json
+#records, so a run costs nothing and the same seed gives the same workload. Every repeat
+#starts from empty caches in a temporary directory.
+
+#Reported per corpus size: latency percentiles for fetch_internships, resume text
+#extraction, hybrid_analyze and graph rendering; the time hybrid_analyze spends in each
+#stage; and API call and token totals.
+
+#python benchmark.py --sizes 50,1000,10000,100000 --repeat 5 --latency-ms 300 --error-rate 0.02
+
+#--startup instead measures the app itself: in fresh processes, the time until the first script
+#run finishes (time to interactive), the cost of later reruns, and which heavy libraries the
+#first run imported.
+
+#python benchmark.py --startup --repeat 5
+
+#Rate limits are off unless --rate-limits is given. tiktoken needs its encoding files once
+#(it caches them locally), after which the benchmark runs without network access.
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+import numpy as np
+import openai
+from requests.structures import CaseInsensitiveDict
+
+import career_graph
+import careernodes_core
+import resume_extraction
+from careernodes_core import AdzunaError, build_search_queries, count_tokens, create_user_profile_text, fetch_internships, hybrid_analyze, normalize_listing
+
+BENCH_SEED = 2025
+FILLER_WORDS = (
+    "analytics backend frontend cloud research marketing finance operations product design "
+    "biology chemistry statistics machine learning data pipelines customer reporting testing "
+    "automation dashboards healthcare policy outreach accounting modeling visualization"
+).split()
+TITLE_PREFIXES = ["Summer", "Fall", "Spring", "Remote", "Junior", "Graduate", "Undergraduate", "Paid"]
+LOCATIONS = ["New York, NY", "San Francisco, CA", "Boston, MA", "Austin, TX", "Chicago, IL", "Remote", "Seattle, WA"]
+PERCENTILES = (50, 90, 99)
+
+
+class FakeLatency:
+    # Thread-safe source of simulated latency (normal around latency_ms, never negative)
+    # and failures
+    def __init__(self, latency_ms, jitter_ms, error_rate, seed):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            delay = max(0.0, self.rng.gauss(self.latency, self.jitter))
+            failed = self.rng.random() < self.error_rate
+        time.sleep(delay)
+        return failed
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = CaseInsensitiveDict(headers)  # Like requests.Response.headers
+
+    def json(self):
+        return self.body
+
+
+class FakeAdzunaSession:
+    # Stands in for requests.Session against the Adzuna search endpoint; every query pages
+    # through the same canned jobs. Failures alternate between 429 (with Retry-After) and 500.
+    def __init__(self, jobs, latency):
+        self.jobs = jobs
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if self.latency.wait():
+            return FakeResponse(429, headers={"Retry-After": "0.1"}) if call % 2 else FakeResponse(500)
+        page = int(url.rstrip("/").rsplit("/", 1)[1])
+        size = int(params.get("results_per_page", 50))
+        return FakeResponse(200, {"results": self.jobs[(page - 1) * size:page * size]})
+
+
+class FakeOpenAI:
+    # Stands in for the module-level openai client: embeddings.create and
+    # chat.completions.create (plain, JSON-schema and streamed replies), with deterministic
+    # output and real token counts
+    def __init__(self, latency, dimension=1536):
+        self.latency = latency
+        self.dimension = dimension
+        self.calls = Counter()
+        self.tokens = Counter()
+        self.lock = threading.Lock()
+        self.embeddings = types.SimpleNamespace(create=self.create_embeddings)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create_chat))
+
+    def count(self, endpoint, prompt_tokens, completion_tokens=0):
+        with self.lock:
+            self.calls[endpoint] += 1
+            self.tokens[f"{endpoint}_prompt"] += prompt_tokens
+            if completion_tokens:
+                self.tokens[f"{endpoint}_completion"] += completion_tokens
+
+    def rate_limit_error(self):
+        request = httpx.Request("POST", "https://api.openai.com/v1")
+        return openai.RateLimitError("Simulated rate limit", response=httpx.Response(429, headers={"retry-after-ms": "100"}, request=request), body=None)
+
+    def create_embeddings(self, input, model, **kwargs):
+        if self.latency.wait():
+            raise self.rate_limit_error()
+        data = []
+        for n, item in enumerate(input):
+            seed = int.from_bytes(hashlib.sha256(json.dumps(item).encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+            data.append(types.SimpleNamespace(index=n, embedding=vector))
+        tokens = sum(len(item) if isinstance(item, list) else count_tokens(item) for item in input)
+        self.count("embeddings", tokens)
+        return types.SimpleNamespace(data=data, usage=types.SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+    def reply_for(self, prompt, response_format):
+        score = int(hashlib.sha256(prompt.encode()).hexdigest()[:4], 16) / 0xFFFF
+        explanation = "Your python and data analysis experience lines up with the core responsibilities, and the location and schedule match what you asked for."
+        name = (response_format or {}).get("json_schema", {}).get("name")
+        if name in ("batch_match", "batch_match_score"):
+            ids = [int(n) for n in re.findall(r"^LISTING (\d+):", prompt, re.M)]
+            matches = [dict({"listing_id": n, "score": round((score * n) % 1, 3)}, **({"explanation": explanation} if name == "batch_match" else {})) for n in ids]
+            return json.dumps({"matches": matches})
+        if name == "match":
+            return json.dumps({"score": round(score, 3), "explanation": explanation})
+        if name == "match_score":
+            return json.dumps({"score": round(score, 3)})
+        if "KEY FACTS" in prompt:
+            return "- B.S. Computer Science, 2026\n- Python, SQL, pandas\n- Data analyst intern, 2024"
+        if prompt.rstrip().endswith("MATCH_SCORE:"):
+            return f"{score:.2f}"
+        return explanation
+
+    def create_chat(self, model, messages, response_format=None, stream=False, **kwargs):
+        if self.latency.wait():
+            raise self.rate_limit_error()
+        prompt = messages[-1]["content"]
+        content = self.reply_for(prompt, response_format)
+        prompt_tokens, completion_tokens = count_tokens(prompt, model), count_tokens(content, model)
+        self.count("chat", prompt_tokens, completion_tokens)
+        usage = types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens)
+        if stream:
+            chunks = [types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=piece))], usage=None) for piece in re.findall(r"\S+\s*", content)]
+            return iter(chunks + [types.SimpleNamespace(choices=[], usage=usage)])
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))], usage=usage)
+
+
+class StageTimer:
+    # Wraps pipeline functions in place so the time spent in each stage adds up per run
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.totals[stage] += seconds
+
+    def wrap(self, module, name, stage):
+        func = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        setattr(module, name, timed)
+
+    def wrap_generator(self, module, name, stage):
+        # Only time spent producing items counts, not the consumer's work between them
+        func = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    self.add(stage, time.perf_counter() - start)
+                    return
+                self.add(stage, time.perf_counter() - start)
+                yield item
+        setattr(module, name, timed)
+
+    def take(self):
+        with self.lock:
+            totals, self.totals = dict(self.totals), defaultdict(float)
+        return totals
+
+
+def make_records(count, seed=BENCH_SEED, path="internships.json"):
+    # internships.json-style records: the real ones, then variations on them
+    with open(path) as f:
+        base = json.load(f)
+    rng = random.Random(seed)
+    records = []
+    for n in range(count):
+        record = dict(base[n % len(base)])
+        if n >= len(base):
+            record["company"] = f"{record['company']} {rng.choice(['Labs', 'Group', 'Partners', 'Inc'])} {n}"
+            record["title"] = f"{rng.choice(TITLE_PREFIXES)} {record['title']}"
+            record["location"] = rng.choice(LOCATIONS)
+            record["description"] = f"{record['description']} " + " ".join(rng.choice(FILLER_WORDS) for _ in range(rng.randint(15, 60)))
+            record["salary_min"] = rng.choice([0, 3000, 5000, 8000])
+            record["salary_max"] = record["salary_min"] + rng.choice([0, 2000, 4000])
+        record["id"] = str(n)
+        records.append(record)
+    return records
+
+
+def to_adzuna(record):
+    return {
+        "id": record["id"], "title": record["title"], "description": record["description"],
+        "company": {"display_name": record["company"]}, "location": {"display_name": record["location"]},
+        "salary_min": record["salary_min"], "salary_max": record["salary_max"],
+        "redirect_url": f"https://www.adzuna.com/details/{record['id']}",
+        "contract_type": record["type"], "contract_time": record["schedule"].lower().replace("-", "_"),
+        "category": {"label": record["industry"]},
+    }
+
+
+def make_resume_pdf(pages):
+    # Minimal text-only PDF, enough for PyPDF2's extractor
+    bodies = {1: "<< /Type /Catalog /Pages 2 0 R >>", 3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for page in range(pages):
+        page_id = 4 + 2 * page
+        lines = [f"Page {page + 1}, line {line}: built data pipelines in python and sql for analytics dashboards" for line in range(45)]
+        stream = "BT /F1 10 Tf 14 TL 50 780 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        bodies[page_id] = f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        bodies[page_id + 1] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+        kids.append(f"{page_id} 0 R")
+    bodies[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(bodies):
+        offsets[obj_id] = out.tell()
+        out.write(f"{obj_id} 0 obj\n{bodies[obj_id]}\nendobj\n".encode())
+    xref = out.tell()
+    out.write(f"xref\n0 {len(bodies) + 1}\n0000000000 65535 f \n".encode())
+    for obj_id in sorted(bodies):
+        out.write(f"{offsets[obj_id]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(bodies) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+BENCH_USER_INPUTS = {
+    "gpa": 3.6, "education": "Undergrad Junior", "school": "State University", "major": "Computer Science",
+    "skills": ["python", "sql", "data analysis"], "location": "New York, NY", "industry": ["Tech"],
+    "org_type": ["Startup"], "schedule": "Full-Time", "salary_min": 4000, "salary_max": None,
+    "start_date": "No preferred date", "end_date": "No preferred date", "work_type": "Hybrid"
+}
+
+
+def reset_pipeline(cache_dir, rate_limits):
+    # Fresh on-disk caches and fresh process-wide singletons, so every repeat runs cold
+    careernodes_core.EMBED_CACHE_PATH = os.path.join(cache_dir, "embeddings.sqlite3")
+    careernodes_core.ADZUNA_CACHE_PATH = os.path.join(cache_dir, "adzuna.sqlite3")
+    if not rate_limits:
+        careernodes_core.OPENAI_REQUESTS_PER_MINUTE = 0
+        careernodes_core.OPENAI_TOKENS_PER_MINUTE = 0
+        careernodes_core.ADZUNA_REQUESTS_PER_MINUTE = 0
+    for getter in (careernodes_core.get_embedding_cache, careernodes_core.get_adzuna_cache, careernodes_core.get_match_cache,
+                   careernodes_core.get_explanation_cache, careernodes_core.get_resume_summary_cache,
+                   careernodes_core.get_api_scheduler):
+        getter.cache_clear()
+
+
+def install_fakes(fake_openai, session):
+    careernodes_core.get_openai_client = lambda: fake_openai
+    careernodes_core.get_http_session = lambda: session
+
+
+def instrument(timer):
+    timer.wrap(careernodes_core, "score_listings", "rule_filters")
+    timer.wrap(careernodes_core, "collapse_near_duplicates", "dedup")
+    timer.wrap(careernodes_core, "local_prefilter", "tfidf_prefilter")
+    timer.wrap(careernodes_core, "embed_texts", "embeddings")
+    timer.wrap_generator(careernodes_core, "iter_score_candidates", "llm_scoring")
+    timer.wrap(careernodes_core, "match_candidates", "llm_stage")
+
+
+def summarize(samples):
+    samples = np.asarray(samples, dtype=float)
+    summary = {f"p{p}": float(np.percentile(samples, p)) for p in PERCENTILES}
+    summary["mean"] = float(samples.mean())
+    return summary
+
+
+def run_size(size, args, timer, pool):
+    records = make_records(size, args.seed)
+    listings = [normalize_listing(record) for record in records]
+    jobs = [to_adzuna(record) for record in records]
+    fetch_target = min(size, args.fetch_max)
+    resume_pdf = make_resume_pdf(args.resume_pages)
+    queries = build_search_queries(BENCH_USER_INPUTS["major"], BENCH_USER_INPUTS["skills"])
+
+    latencies = defaultdict(list)
+    stages = defaultdict(list)
+    calls = Counter()
+    tokens = Counter()
+    for repeat in range(args.repeat):
+        latency = FakeLatency(args.latency_ms, args.jitter_ms, args.error_rate, args.seed + repeat)
+        fake_openai = FakeOpenAI(latency, args.dimension)
+        session = FakeAdzunaSession(jobs, latency)
+        install_fakes(fake_openai, session)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            reset_pipeline(cache_dir, args.rate_limits)
+            timer.take()
+
+            start = time.perf_counter()
+            try:
+                fetch_internships(queries, BENCH_USER_INPUTS["location"], max_pages=math.ceil(fetch_target / 50), target_count=fetch_target)
+            except AdzunaError:
+                pass  # Every first page failed; at a high --error-rate that's part of the workload
+            latencies["fetch_internships"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            resume_text = resume_extraction.extract_text("resume.pdf", resume_pdf, pool, args.resume_workers)
+            latencies["extract_text_from_resume"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            profile_text = create_user_profile_text(BENCH_USER_INPUTS, resume_text)
+            results = hybrid_analyze(profile_text, [dict(listing) for listing in listings], None, BENCH_USER_INPUTS["skills"], BENCH_USER_INPUTS)
+            latencies["hybrid_analyze"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            career_graph.build_graph_html([(score, listing["company"], listing["title"], listing["redirect_url"]) for score, listing, _ in results])
+            latencies["graph_render"].append(time.perf_counter() - start)
+
+            stage_totals = timer.take()
+            stage_totals["explanations"] = stage_totals.pop("llm_stage", 0.0) - stage_totals.get("llm_scoring", 0.0)
+            for stage, seconds in stage_totals.items():
+                stages[stage].append(seconds)
+            calls.update(fake_openai.calls)
+            calls["adzuna"] += session.calls
+            tokens.update(fake_openai.tokens)
+
+    return {
+        "size": size,
+        "latency_seconds": {name: summarize(samples) for name, samples in latencies.items()},
+        "hybrid_analyze_stage_seconds": {stage: float(np.mean(samples)) for stage, samples in stages.items()},
+        "api_calls_per_run": {name: count / args.repeat for name, count in calls.items()},
+        "tokens_per_run": {name: count / args.repeat for name, count in tokens.items()},
+    }
+
+
+HEAVY_MODULES = ("openai", "sklearn", "pyvis", "networkx", "PyPDF2", "tiktoken", "requests")
+STARTUP_SCRIPT = """
+import json, logging, sys, time
+started = time.perf_counter()
+script_runs = []
+class ScriptRuns(logging.Handler):
+    def emit(self, record):
+        script_runs.append(json.loads(record.getMessage())["wall_seconds"])
+logging.getLogger("careernodes.metrics").addHandler(ScriptRuns())
+logging.getLogger("careernodes.metrics").setLevel(logging.INFO)
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.secrets["benchmark"] = True  # The app reads st.secrets, which fails without any secrets source
+app.run()
+first_run = time.perf_counter() - started
+loaded = sorted(name for name in sys.argv[3].split(",") if name in sys.modules)
+reruns = []
+for _ in range(int(sys.argv[2])):
+    started = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - started)
+print(json.dumps({"first_run": first_run, "reruns": reruns, "script_reruns": script_runs[1:], "loaded": loaded, "errors": [str(e.value) for e in app.exception]}))
+"""
+
+
+def run_startup(repeat, reruns=10, app_path="CareerNodes.py"):
+    # Every sample is a new interpreter, so nothing is already imported or cached. A rerun
+    # through AppTest includes its own polling; the app's metrics log gives the time spent
+    # in the script itself.
+    first_runs, rerun_times, script_times, loaded = [], [], [], set()
+    env = dict(os.environ, METRICS_ENABLED="1")
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, app_path, str(reruns), ",".join(HEAVY_MODULES)], capture_output=True, text=True, check=True, env=env).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        if sample["errors"]:
+            raise RuntimeError(f"{app_path} failed: {sample['errors']}")
+        first_runs.append(sample["first_run"])
+        rerun_times += sample["reruns"]
+        script_times += sample["script_reruns"]
+        loaded.update(sample["loaded"])
+    return {
+        "time_to_interactive_seconds": summarize(first_runs), "rerun_seconds": summarize(rerun_times),
+        "rerun_script_seconds": summarize(script_times), "heavy_modules_loaded": sorted(loaded)
+    }
+
+
+def print_startup_report(report):
+    print(f"{'operation':<26}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES) + f"{'mean':>10}")
+    for name in ("time_to_interactive_seconds", "rerun_seconds", "rerun_script_seconds"):
+        summary = report[name]
+        print(f"{name[:-8]:<26}" + "".join(f"{summary['p' + str(p)] * 1000:>8.1f}ms" for p in PERCENTILES) + f"{summary['mean'] * 1000:>8.1f}ms")
+    print("Heavy modules imported by the first run: " + (", ".join(report["heavy_modules_loaded"]) or "none"))
+
+
+def print_report(report):
+    print(f"\n== {report['size']} listings ==")
+    print(f"{'operation':<26}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES) + f"{'mean':>10}")
+    for name, summary in report["latency_seconds"].items():
+        print(f"{name:<26}" + "".join(f"{summary['p' + str(p)] * 1000:>8.1f}ms" for p in PERCENTILES) + f"{summary['mean'] * 1000:>8.1f}ms")
+    print("hybrid_analyze stages (mean): " + ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in report["hybrid_analyze_stage_seconds"].items()))
+    print("API calls per run: " + ", ".join(f"{name} {count:g}" for name, count in sorted(report["api_calls_per_run"].items())))
+    print("Tokens per run: " + ", ".join(f"{name} {count:g}" for name, count in sorted(report["tokens_per_run"].items())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CareerNodes pipeline against local API stand-ins.")
+    parser.add_argument("--sizes", default="50,1000,10000,100000", help="comma-separated corpus sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=200, help="mean simulated API latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of API calls that fail (429/500)")
+    parser.add_argument("--dimension", type=int, default=1536, help="fake embedding dimension")
+    parser.add_argument("--fetch-max", type=int, default=careernodes_core.ADZUNA_TARGET_RESULTS, help="listings pulled in the fetch_internships benchmark")
+    parser.add_argument("--resume-pages", type=int, default=8)
+    parser.add_argument("--resume-workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--rate-limits", action="store_true", help="keep the scheduler's rate limits on")
+    parser.add_argument("--seed", type=int, default=BENCH_SEED)
+    parser.add_argument("--json", help="also write the full report to this file")
+    parser.add_argument("--startup", action="store_true", help="measure app start-up and rerun time instead of the pipeline")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = run_startup(args.repeat)
+        print_startup_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+        sys.exit(0)
+
+    timer = StageTimer()
+    instrument(timer)
+    reports = []
+    with ProcessPoolExecutor(max_workers=args.resume_workers) as pool:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            reports.append(run_size(size, args, timer, pool))
+            print_report(reports[-1])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
@@ -0,0 +1,70 @@
+#Career network graph for CareerNodes: the pyvis page shown under the match cards.
+#Kept outside of CareerNodes.py so it can be built (and benchmarked) without Streamlit.
+#pyvis is imported with the first graph rather than at start-up.
+
+import re
+
+import numpy as np
+
+
+GRAPH_MIN_RADIUS = 80
+GRAPH_MAX_RADIUS = 400
+# pyvis links vis-network from a CDN; the vendored copy in static/lib is served once by
+# Streamlit's static file server (.streamlit/config.toml) and cached by the browser instead
+GRAPH_STATIC_ASSETS = {
+    "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js": "/app/static/lib/vis-9.1.2/vis-network.min.js",
+    "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css": "/app/static/lib/vis-9.1.2/vis-network.css",
+}
+
+
+def graph_positions(scores):
+    # Spread the nodes evenly around "You", lower scores further out
+    scores = np.asarray(scores, dtype=float)
+    if len(scores) and scores.max() != scores.min():
+        norm = (scores.max() - scores.min()) / (scores - scores.min() + 0.05)
+    else:
+        norm = np.ones(len(scores))
+    # Apply non-linear scaling for stronger visual distinction
+    radius = (GRAPH_MIN_RADIUS + np.sqrt(norm) * (GRAPH_MAX_RADIUS - GRAPH_MIN_RADIUS)) * 1.25
+    angles = np.radians(np.arange(len(scores)) * (360 / len(scores) if len(scores) else 1))
+    return radius * np.cos(angles), radius * np.sin(angles)
+
+
+def build_graph_html(nodes):
+    # nodes is a sequence of (score, company, title, redirect_url); the page is built in
+    # memory and nothing is written to disk
+    from pyvis.network import Network
+    G = Network(height="650px", width="100%", bgcolor="rgba(26, 26, 46, 0.5)", font_color="rgba(26, 26, 46, 0.5)", directed=False, cdn_resources="remote")
+    G.add_node("You", label="You", color="#FF3366", size=50, shape="dot", physics=False, x=0, y=0)
+
+    xs, ys = graph_positions([score for score, _, _, _ in nodes])
+    for (score, company, title, redirect_url), x, y in zip(nodes, xs.tolist(), ys.tolist()):
+        title = f"{company} - {title}"
+        score_str = f"Score: {score:.3f}"
+        node_args = dict(color=f"rgba({int(255 - score*200)}, {int(score*200)}, 150, 0.9)", size=28 + score*28, x=x, y=y, physics=False, font={"multi": True, "vadjust": -20, "size": 18, "face": "monospace"})
+        if redirect_url:
+            label = f'{title}\n{score_str}\n🔗{redirect_url}'
+            node_args['url'] = redirect_url
+        else:
+            label = f'{title}\n{score_str}'
+        G.add_node(label, label=label, **node_args)
+        G.add_edge("You", label, color="#00d4ff", value=score*5)
+
+    G.set_options("""
+    var options = {
+        "physics": {
+            "enabled": false
+        }
+    }
+    """)
+
+    source_code = G.generate_html()
+    for cdn_url, static_url in GRAPH_STATIC_ASSETS.items():
+        # The CDN's integrity hash doesn't apply to the locally served file, so it is dropped
+        # from the rewritten tag only; every other CDN tag keeps its hash
+        source_code = re.sub(
+            rf'<[^<>]*"{re.escape(cdn_url)}"[^<>]*>',
+            lambda tag: re.sub(r'\s+integrity="[^"]*"', "", tag.group(0)).replace(cdn_url, static_url),
+            source_code,
+        )
+    return source_code
@@ -0,0 +1,1139 @@
+#CareerNodes core: the matching pipeline behind CareerNodes.py (Adzuna fetching,
+#profile text, embeddings, LLM scoring and their caches), importable without Streamlit.
+
+#API keys are read from the environment / .env; the Streamlit app overrides them from
+#st.secrets when those are configured.
+
+#The OpenAI SDK, requests, tiktoken and scikit-learn are imported by the first function that
+#needs them rather than here, so starting the app (and every new worker process) doesn't pay
+#for libraries a run may never use.
+
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+import numpy as np
+from dotenv import load_dotenv
+
+import metrics
+from api_scheduler import BACKGROUND, APIScheduler, retry_after_seconds, submit_in_context
+from listing_dedup import canonical_indices, collapse_near_duplicates
+from listing_rules import score_listings
+
+# Load environment variables
+load_dotenv()
+
+ADZUNA_APP_ID = os.getenv("ADZUNA_APP_ID")
+ADZUNA_APP_KEY = os.getenv("ADZUNA_APP_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+ADZUNA_COUNTRY = "us"
+ADZUNA_MAX_PAGES = int(os.getenv("ADZUNA_MAX_PAGES", 3))
+ADZUNA_MAX_QUERIES = int(os.getenv("ADZUNA_MAX_QUERIES", 4))
+ADZUNA_TARGET_RESULTS = int(os.getenv("ADZUNA_TARGET_RESULTS", 200))
+ADZUNA_MAX_WORKERS = int(os.getenv("ADZUNA_MAX_WORKERS", 8))
+ADZUNA_TIMEOUT_SECONDS = float(os.getenv("ADZUNA_TIMEOUT_SECONDS", 10))
+# Adzuna responses are fresh for ADZUNA_CACHE_TTL_SECONDS; after that they are still served
+# (and refreshed in the background) until ADZUNA_CACHE_STALE_SECONDS old
+ADZUNA_CACHE_PATH = os.getenv("ADZUNA_CACHE_PATH", os.path.join(".cache", "adzuna.sqlite3"))
+ADZUNA_CACHE_TTL_SECONDS = int(os.getenv("ADZUNA_CACHE_TTL_SECONDS", 3600))
+ADZUNA_CACHE_STALE_SECONDS = int(os.getenv("ADZUNA_CACHE_STALE_SECONDS", 7 * 24 * 3600))
+ADZUNA_CACHE_MAX_ENTRIES = int(os.getenv("ADZUNA_CACHE_MAX_ENTRIES", 5000))
+
+# LLM scoring settings
+CHAT_MODEL = "gpt-4o"
+LLM_TOP_CANDIDATES = int(os.getenv("LLM_TOP_CANDIDATES", 20))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 20))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+# "structured": one JSON-schema request per listing returning score + explanation
+# "batch": one JSON-schema request per LLM_BATCH_SIZE listings sharing one copy of the profile
+# "separate": the original two free-text requests per listing
+LLM_SCORING_MODE = os.getenv("LLM_SCORING_MODE", "structured")
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", 5))
+# "lazy": scoring requests ask for the score only; explanations are written when a card is
+# opened (or ahead of time for the best EXPLAIN_TOP_N matches)
+# "eager": every scoring request also returns its explanation
+EXPLANATION_MODE = os.getenv("EXPLANATION_MODE", "lazy")
+EXPLAIN_TOP_N = int(os.getenv("EXPLAIN_TOP_N", 3))
+# Cascade cut sizes: the local TF-IDF stage keeps CASCADE_LOCAL_KEEP listings for the
+# embedding stage (0 disables it), which keeps LLM_TOP_CANDIDATES for the LLM stage
+CASCADE_LOCAL_KEEP = int(os.getenv("CASCADE_LOCAL_KEEP", 100))
+CASCADE_SKILL_WEIGHT = int(os.getenv("CASCADE_SKILL_WEIGHT", 3))
+# Share of the final match score taken from the structured rule score (listing_rules.py)
+RULE_SCORE_WEIGHT = float(os.getenv("RULE_SCORE_WEIGHT", 0.15))
+# Bump PROMPT_VERSION whenever the scoring prompts change so stale memoized scores are ignored
+PROMPT_VERSION = "2025-06-1"
+MATCH_CACHE_TTL_SECONDS = int(os.getenv("MATCH_CACHE_TTL_SECONDS", 24 * 3600))
+MATCH_CACHE_MAX_ENTRIES = int(os.getenv("MATCH_CACHE_MAX_ENTRIES", 20000))
+# Token budgets (counted with the chat model's tokenizer). The profile, resume included, is
+# compacted to PROFILE_MAX_TOKENS once and reused in every prompt; resumes longer than
+# RESUME_SUMMARY_MIN_TOKENS are first condensed into key facts by RESUME_SUMMARY_MODEL.
+# Job descriptions are cut to JOB_DESCRIPTION_MAX_TOKENS and replies to the *_MAX_TOKENS caps.
+PROFILE_MAX_TOKENS = int(os.getenv("PROFILE_MAX_TOKENS", 1200))
+RESUME_SUMMARY_MIN_TOKENS = int(os.getenv("RESUME_SUMMARY_MIN_TOKENS", 400))
+RESUME_SUMMARY_MAX_TOKENS = int(os.getenv("RESUME_SUMMARY_MAX_TOKENS", 600))
+RESUME_SUMMARY_MODEL = os.getenv("RESUME_SUMMARY_MODEL", CHAT_MODEL)
+JOB_DESCRIPTION_MAX_TOKENS = int(os.getenv("JOB_DESCRIPTION_MAX_TOKENS", 600))
+SCORE_MAX_TOKENS = int(os.getenv("SCORE_MAX_TOKENS", 40))
+EXPLANATION_MAX_TOKENS = int(os.getenv("EXPLANATION_MAX_TOKENS", 250))
+# Shared per-process rate limits (see api_scheduler.py); 0 disables a limit
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", 300000))
+ADZUNA_REQUESTS_PER_MINUTE = int(os.getenv("ADZUNA_REQUESTS_PER_MINUTE", 25))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", 4))
+API_BACKOFF_BASE_SECONDS = float(os.getenv("API_BACKOFF_BASE_SECONDS", 0.5))
+API_BACKOFF_MAX_SECONDS = float(os.getenv("API_BACKOFF_MAX_SECONDS", 20))
+
+# Embedding settings (text-embedding-ada-002 accepts up to 8191 tokens per input
+# and up to 2048 inputs per request)
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBED_MAX_INPUT_TOKENS = int(os.getenv("EMBED_MAX_INPUT_TOKENS", 8191))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", 200000))
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", 256))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", 4))
+EMBED_OVERSIZE_STRATEGY = os.getenv("EMBED_OVERSIZE_STRATEGY", "split")  # "split" or "truncate"
+
+# Persistent embedding cache shared by every session and process on this machine
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBED_CACHE_TTL_SECONDS = int(os.getenv("EMBED_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", 50000))
+
+class AdzunaError(Exception):
+    pass
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    # One client, and so one connection pool, per process
+    import openai
+    return openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0)  # Retries are handled by call_with_retries below
+
+def is_retryable_error(error):
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+@lru_cache(maxsize=None)
+def get_api_scheduler():
+    # One scheduler per process, shared by every Streamlit session
+    return APIScheduler({
+        "openai": (OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE),
+        "adzuna": (ADZUNA_REQUESTS_PER_MINUTE, 0),
+    })
+
+def backoff_seconds(attempt):
+    return random.uniform(0, min(API_BACKOFF_MAX_SECONDS, API_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+def call_with_retries(func, *args, estimated_tokens=0, **kwargs):
+    # Every attempt waits for an OpenAI slot from the shared scheduler. 429/5xx/timeouts are
+    # retried after the server's retry-after (which pauses every caller), or otherwise with
+    # exponential backoff and full jitter.
+    scheduler = get_api_scheduler()
+    for attempt in range(API_MAX_RETRIES + 1):
+        metrics.count("api_wait_seconds", scheduler.acquire("openai", estimated_tokens), provider="openai")
+        metrics.count("api_calls", provider="openai")
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            metrics.count("api_errors", provider="openai", error=type(error).__name__)
+            if attempt == API_MAX_RETRIES or not is_retryable_error(error):
+                raise
+            metrics.count("api_retries", provider="openai")
+            delay = retry_after_seconds(getattr(getattr(error, "response", None), "headers", None))
+            if delay is not None:
+                scheduler.pause("openai", delay)
+            else:
+                time.sleep(backoff_seconds(attempt))
+
+class TTLCache:
+    # Thread-safe in-memory LRU cache whose entries expire after ttl_seconds
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.time(), value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entries": len(self.data), "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+class EmbeddingCache:
+    # Content-addressed store: key = sha256(model + text), value = float32 vector bytes.
+    # Entries expire after ttl_seconds and the least recently used rows are evicted
+    # once the table grows past max_entries.
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(text, model):
+        return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self.lock:
+            unique_keys = list(set(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))}) AND created_at >= ?",
+                    chunk + [now - self.ttl_seconds]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, k) for k in found])
+                self.conn.commit()
+        return found
+
+    def put_many(self, items, model):
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                [(key, model, np.asarray(vector, dtype=np.float32).tobytes(), now, now) for key, vector in items]
+            )
+            self.evict(now)
+            self.conn.commit()
+
+    def evict(self, now):
+        self.conn.execute("DELETE FROM embeddings WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+@lru_cache(maxsize=None)
+def get_embedding_cache():
+    return EmbeddingCache(EMBED_CACHE_PATH, EMBED_CACHE_TTL_SECONDS, EMBED_CACHE_MAX_ENTRIES)
+
+class ResponseCache:
+    # Two-tier (memory + SQLite) cache for API responses. Concurrent callers for the same key
+    # share one in-flight request, and stale entries are served immediately while a
+    # background refresh runs, so a slow or failing API doesn't reach the user.
+    def __init__(self, path, ttl_seconds, stale_seconds, max_entries, name="responses"):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.memory = TTLCache(stale_seconds, max_entries)
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.refresher = ThreadPoolExecutor(max_workers=2)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is None:
+            with self.lock:
+                row = self.conn.execute("SELECT body, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = (row[1], json.loads(row[0]))
+                self.memory.set(key, entry)
+        if entry is not None and time.time() - entry[0] > self.stale_seconds:
+            return None
+        return entry
+
+    def store(self, key, value):
+        now = time.time()
+        self.memory.set(key, (now, value))
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses (key, body, fetched_at) VALUES (?, ?, ?)", (key, json.dumps(value), now))
+            self.conn.execute("DELETE FROM responses WHERE fetched_at < ?", (now - self.stale_seconds,))
+            self.conn.commit()
+
+    def fetch_once(self, key, fetch):
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[key] = future
+        if not leader:
+            return future.result()
+        try:
+            value = fetch()
+            if value is not None:
+                self.store(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def get(self, key, fetch):
+        # fetch() returns None on failure; failures are never cached
+        entry = self.lookup(key)
+        metrics.count_cache(self.name, entry is not None, entry is None)
+        if entry is None:
+            return self.fetch_once(key, fetch)
+        if time.time() - entry[0] > self.ttl_seconds:
+            metrics.count("cache_stale_hits", cache=self.name)
+            submit_in_context(self.refresher, self.fetch_once, key, fetch, priority=BACKGROUND)
+        return entry[1]
+
+@lru_cache(maxsize=None)
+def get_adzuna_cache():
+    return ResponseCache(ADZUNA_CACHE_PATH, ADZUNA_CACHE_TTL_SECONDS, ADZUNA_CACHE_STALE_SECONDS, ADZUNA_CACHE_MAX_ENTRIES, name="adzuna")
+
+@lru_cache(maxsize=None)
+def get_http_session():
+    # One pooled session per process so Adzuna requests reuse TLS connections
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=ADZUNA_MAX_WORKERS)
+    session.mount("https://", adapter)
+    return session
+
+def build_search_queries(major, skills):
+    # "internship" alone plus narrower searches built from the user's major and skills
+    queries = ["internship"]
+    for term in [major] + list(skills):
+        term = (term or "").strip()
+        query = f"{term} internship"
+        if term and query.lower() not in [q.lower() for q in queries]:
+            queries.append(query)
+    return queries[:ADZUNA_MAX_QUERIES]
+
+def fetch_adzuna_page(query, location, page, results_limit):
+    key = json.dumps([ADZUNA_COUNTRY, query.strip().lower(), (location or "").strip().lower(), page, results_limit])
+    return get_adzuna_cache().get(key, lambda: request_adzuna_page(query, location, page, results_limit))
+
+def request_adzuna_page(query, location, page, results_limit):
+    import requests
+    url = f"https://api.adzuna.com/v1/api/jobs/{ADZUNA_COUNTRY}/search/{page}"
+    params = {
+        'app_id': ADZUNA_APP_ID,
+        'app_key': ADZUNA_APP_KEY,
+        'what': query,
+        'where': location,
+        'results_per_page': results_limit,
+        'content-type': 'application/json'
+    }
+    scheduler = get_api_scheduler()
+    for attempt in range(API_MAX_RETRIES + 1):
+        metrics.count("api_wait_seconds", scheduler.acquire("adzuna"), provider="adzuna")
+        metrics.count("api_calls", provider="adzuna")
+        try:
+            response = get_http_session().get(url, params=params, timeout=ADZUNA_TIMEOUT_SECONDS)
+        except requests.RequestException as error:
+            metrics.count("api_errors", provider="adzuna", error=type(error).__name__)
+            return None
+        if response.status_code == 200:
+            return response.json().get('results', [])
+        metrics.count("api_errors", provider="adzuna", error=str(response.status_code))
+        # Only rate-limit replies are retried, after pausing every Adzuna caller
+        delay = retry_after_seconds(getattr(response, "headers", None))
+        if response.status_code != 429 or attempt == API_MAX_RETRIES:
+            return None
+        metrics.count("api_retries", provider="adzuna")
+        scheduler.pause("adzuna", backoff_seconds(attempt) if delay is None else delay)
+    return None
+
+def normalize_listing(job):
+    # Flattens a raw Adzuna result (nested company/location/category objects) or an
+    # internships.json record into the listing dict used everywhere else
+    if isinstance(job.get("company"), dict) or isinstance(job.get("location"), dict):
+        return {
+            "id": str(job.get("id", "")),
+            "company": job.get("company", {}).get("display_name", "Unknown"),
+            "title": job.get("title", "Unknown Title"),
+            "description": job.get("description", ""),
+            "location": job.get("location", {}).get("display_name", "Unknown Location"),
+            "salary_min": job.get("salary_min") or 0,
+            "salary_max": job.get("salary_max") or 0,
+            "redirect_url": job.get("redirect_url", ""),
+            "work_type": job.get("contract_type", "Not specified"),
+            "schedule": job.get("contract_time", "Not specified"),
+            "industry": job.get("category", {}).get("label", "Not specified"),
+            "org_type": job.get("company", {}).get("label", "Not specified"),
+        }
+    return {
+        "id": str(job.get("id", "")),
+        "company": job.get("company", "Unknown"),
+        "title": job.get("title", "Unknown Title"),
+        "description": job.get("description", ""),
+        "location": job.get("location", "Unknown Location"),
+        "salary_min": job.get("salary_min") or 0,
+        "salary_max": job.get("salary_max") or 0,
+        "redirect_url": job.get("redirect_url", ""),
+        "work_type": job.get("type", "Not specified"),
+        "schedule": job.get("schedule", "Not specified"),
+        "industry": job.get("industry", "Not specified"),
+        "org_type": job.get("org_type", "Not specified"),
+    }
+
+@metrics.timed("fetch_listings")
+def fetch_internships(query, location, results_limit=50, max_pages=ADZUNA_MAX_PAGES, target_count=ADZUNA_TARGET_RESULTS):
+    # query may be a single search string or a list of them. Page 1 of every query is
+    # fetched concurrently, then page 2, and so on until target_count unique listings
+    # are collected or every query runs out of results.
+    queries = [query] if isinstance(query, str) else list(query)
+    results = []
+    seen_ids = set()
+    active = list(queries)
+    any_success = False
+    with ThreadPoolExecutor(max_workers=max(1, min(ADZUNA_MAX_WORKERS, len(queries)))) as executor:
+        for page in range(1, max_pages + 1):
+            if not active or len(results) >= target_count:
+                break
+            futures = [submit_in_context(executor, fetch_adzuna_page, q, location, page, results_limit) for q in active]
+            pages = [future.result() for future in futures]
+            still_active = []
+            for q, jobs in zip(active, pages):
+                if jobs is None:
+                    continue
+                any_success = True
+                for job in jobs:
+                    job_id = job.get("id") or job.get("redirect_url")
+                    if job_id not in seen_ids:
+                        seen_ids.add(job_id)
+                        results.append(job)
+                if len(jobs) >= results_limit:
+                    still_active.append(q)
+            active = still_active
+    if not any_success:
+        raise AdzunaError("Failed to fetch data from Adzuna API.")
+    return results[:target_count]
+
+@lru_cache(maxsize=None)
+def get_resume_summary_cache():
+    return TTLCache(MATCH_CACHE_TTL_SECONDS, MATCH_CACHE_MAX_ENTRIES)
+
+def record_token_usage(purpose, usage):
+    # Token usage goes to the active metrics run, which the debug panel and exports read
+    if usage is None:
+        return
+    metrics.count("tokens", usage.prompt_tokens or 0, purpose=purpose, kind="prompt")
+    metrics.count("tokens", getattr(usage, "completion_tokens", 0) or 0, purpose=purpose, kind="completion")  # Embeddings have none
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text, model=CHAT_MODEL):
+    return len(get_encoding(model).encode(text or "", disallowed_special=()))
+
+def truncate_to_tokens(text, max_tokens, model=CHAT_MODEL):
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text or "", disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    # The " ..." marker counts against max_tokens; with no room for any text nothing is kept
+    keep = max_tokens - len(encoding.encode(" ..."))
+    return encoding.decode(tokens[:keep]).rstrip() + " ..." if keep > 0 else ""
+
+RESUME_SUMMARY_INSTRUCTIONS = "Condense the RESUME below into the key facts an internship matcher needs: education (school, degree, major, dates, GPA), skills and tools, work and research experience (role, organization, dates, one line on what was done), notable projects, certifications and awards. Use short bullet points, keep names and numbers exact, and leave out anything else."
+
+def summarize_resume(resume_text):
+    # Memoized per resume text; if the request fails the raw text is used (and truncated
+    # to the profile budget by the caller)
+    cache = get_resume_summary_cache()
+    key = text_hash(json.dumps([PROMPT_VERSION, RESUME_SUMMARY_MODEL, resume_text]))
+    summary = cache.get(key)
+    metrics.count_cache("resume_summary", summary is not None, summary is None)
+    if summary is not None:
+        return summary
+    prompt = f"{RESUME_SUMMARY_INSTRUCTIONS}\n\nRESUME:\n{resume_text}\n\nKEY FACTS:\n"
+    try:
+        summary = chat(prompt, RESUME_SUMMARY_MODEL, purpose="resume_summary", max_tokens=RESUME_SUMMARY_MAX_TOKENS)
+    except Exception:
+        return resume_text
+    cache.set(key, summary)
+    return summary
+
+def compact_resume_text(resume_text, max_tokens):
+    # Short resumes are kept verbatim; longer ones are summarized once, then everything is
+    # held to max_tokens
+    if not resume_text or not resume_text.strip():
+        return ""
+    if count_tokens(resume_text) > min(max_tokens, RESUME_SUMMARY_MIN_TOKENS):
+        resume_text = summarize_resume(resume_text)
+    return truncate_to_tokens(resume_text, max_tokens)
+
+@metrics.timed("profile")
+def create_user_profile_text(user_inputs, resume_text):
+    # The compact profile is what every embedding and chat prompt sees, so it is held to
+    # PROFILE_MAX_TOKENS with the resume taking whatever the form fields leave; fields that
+    # fill the budget on their own (e.g. a very long skills list) are truncated instead
+    profile_parts = [
+        f"GPA: {user_inputs['gpa'] if user_inputs['gpa'] is not None else 'No GPA Provided'}",
+        f"Education Level: {user_inputs['education']}",
+        f"School: {user_inputs['school']}",
+        f"Current Major or Intended Major: {user_inputs['major'] if user_inputs['major'] else 'No Major Provided'}",
+        f"Skills: {', '.join(user_inputs['skills'])}",
+        f"Preferred Location: {user_inputs['location']}",
+        f"Preferred Industry: {', '.join(user_inputs['industry'])}",
+        f"Preferred Org Type: {', '.join(user_inputs['org_type'])}",
+        f"Preferred Schedule: {user_inputs['schedule']}",
+        f"Desired Salary: {user_inputs['salary_min']} - {user_inputs['salary_max']}",
+        f"Preferred Timeline Start: {user_inputs['start_date']}",
+        f"Preferred Timeline End: {user_inputs['end_date']}"
+    ]
+    resume_budget = PROFILE_MAX_TOKENS - count_tokens("\n".join(profile_parts)) - 5
+    if resume_budget > 0:
+        resume_text = compact_resume_text(resume_text, resume_budget)
+        profile_parts.append(f"Resume: {resume_text if resume_text else 'No resume provided'}")
+    return truncate_to_tokens("\n".join(profile_parts), PROFILE_MAX_TOKENS)
+
+def tokenize_for_embedding(text, model=EMBEDDING_MODEL):
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text or " ", disallowed_special=())
+    if len(tokens) <= EMBED_MAX_INPUT_TOKENS:
+        return [tokens]
+    if EMBED_OVERSIZE_STRATEGY == "truncate":
+        return [tokens[:EMBED_MAX_INPUT_TOKENS]]
+    # Split oversized texts into chunks that each fit in a single embedding input
+    return [tokens[i:i + EMBED_MAX_INPUT_TOKENS] for i in range(0, len(tokens), EMBED_MAX_INPUT_TOKENS)]
+
+def pack_embedding_batches(chunks):
+    # chunks is a list of (text_index, tokens); group them into requests that stay
+    # under both the per-request item budget and the per-request token budget
+    batches = []
+    current = []
+    current_tokens = 0
+    for chunk in chunks:
+        size = len(chunk[1])
+        if current and (len(current) >= EMBED_BATCH_MAX_ITEMS or current_tokens + size > EMBED_BATCH_MAX_TOKENS):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(chunk)
+        current_tokens += size
+    if current:
+        batches.append(current)
+    return batches
+
+def embed_batch(batch, model=EMBEDDING_MODEL):
+    import openai
+    try:
+        response = call_with_retries(get_openai_client().embeddings.create, input=[tokens for _, tokens in batch], model=model, estimated_tokens=sum(len(tokens) for _, tokens in batch))
+        record_token_usage("embedding", getattr(response, "usage", None))
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+    except openai.BadRequestError:
+        if len(batch) == 1:
+            return [None]
+        # Retry the inputs one at a time so a single bad listing can't fail the whole batch
+        return [embed_batch([chunk], model)[0] for chunk in batch]
+
+def embed_texts(texts, model=EMBEDDING_MODEL):
+    # Only texts that are not already in the persistent cache are sent to the API
+    cache = get_embedding_cache()
+    keys = [EmbeddingCache.make_key(text, model) for text in texts]
+    cached = cache.get_many(keys)
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    metrics.count_cache("embeddings", len(keys) - len(missing), len(missing))
+    if missing:
+        fresh = embed_uncached_texts(list(missing.values()), model)
+        new_items = [(key, vector) for key, vector in zip(missing, fresh) if np.any(vector)]
+        cache.put_many(new_items, model)
+        cached.update(zip(missing, fresh))
+
+    return np.vstack([cached[key] for key in keys]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+def embed_uncached_texts(texts, model=EMBEDDING_MODEL):
+    chunks = []
+    for text_index, text in enumerate(texts):
+        for tokens in tokenize_for_embedding(text, model):
+            chunks.append((text_index, tokens))
+    batches = pack_embedding_batches(chunks)
+
+    # Send every batch concurrently and collect the vectors in submission order
+    with ThreadPoolExecutor(max_workers=max(1, min(EMBED_MAX_WORKERS, len(batches)))) as executor:
+        futures = [submit_in_context(executor, embed_batch, batch, model) for batch in batches]
+        batch_vectors = [future.result() for future in futures]
+
+    dimension = next((len(v) for vectors in batch_vectors for v in vectors if v is not None), 0)
+    sums = np.zeros((len(texts), dimension), dtype=np.float32)
+    for batch, vectors in zip(batches, batch_vectors):
+        for (text_index, tokens), vector in zip(batch, vectors):
+            if vector is not None:
+                # Weight split chunks by their token count when averaging
+                sums[text_index] += len(tokens) * np.asarray(vector, dtype=np.float32)
+
+    # Re-normalize so dot products stay cosine similarities; failed inputs remain zero vectors
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return sums / norms
+
+MATCH_CRITERIA = "Take into account the user's GPA, skills, preferred location, education level, prior experience, preferred work type, preferred salary, preferred schedule, preferred industry, preferred organization type, desired timeline, any details from their resume, and current or intended major if provided, and how well that aligns with what both the user and job is looking for and/or requiring."
+MATCH_SCORE_RULES = "Do not give any listings 0 unless nothing of the user data matches the job listing. In addition to your original analysis/score following the preceeding instructions, if the job listing is not hiring the user's education level or is completelyunrelated to the user's skill set and major/career path, rank it lower."
+EXPLANATION_UNAVAILABLE = "Explanation unavailable right now. Please try again later."
+EXPLANATION_INSTRUCTIONS = "Explain in 2-3 sentences why this job listing is a good match for you based on your profile. Be specific, professional, and helpful."
+
+MATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number", "description": "MATCH_SCORE from 0 to 1"},
+        "explanation": {"type": "string"}
+    },
+    "required": ["score", "explanation"],
+    "additionalProperties": False
+}
+
+BATCH_MATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "matches": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "listing_id": {"type": "integer"},
+                    "score": {"type": "number", "description": "MATCH_SCORE from 0 to 1"},
+                    "explanation": {"type": "string"}
+                },
+                "required": ["listing_id", "score", "explanation"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["matches"],
+    "additionalProperties": False
+}
+
+SCORE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number", "description": "MATCH_SCORE from 0 to 1"}
+    },
+    "required": ["score"],
+    "additionalProperties": False
+}
+
+BATCH_SCORE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "matches": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "listing_id": {"type": "integer"},
+                    "score": {"type": "number", "description": "MATCH_SCORE from 0 to 1"}
+                },
+                "required": ["listing_id", "score"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["matches"],
+    "additionalProperties": False
+}
+
+@lru_cache(maxsize=None)
+def get_match_cache():
+    return TTLCache(MATCH_CACHE_TTL_SECONDS, MATCH_CACHE_MAX_ENTRIES)
+
+@lru_cache(maxsize=None)
+def get_explanation_cache():
+    return TTLCache(MATCH_CACHE_TTL_SECONDS, MATCH_CACHE_MAX_ENTRIES)
+
+@lru_cache(maxsize=None)
+def get_explanation_executor():
+    return ThreadPoolExecutor(max_workers=max(1, LLM_MAX_CONCURRENCY))
+
+# In-flight explanation requests, so a prefetch and an opened card share one model call
+_explanation_futures = {}
+_explanation_lock = threading.Lock()
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def normalized_profile_hash(user_profile_text):
+    # Whitespace and case differences don't change what the model sees in any meaningful way
+    return text_hash(" ".join(user_profile_text.split()).casefold())
+
+def match_cache_key(profile_hash, job_text, model=CHAT_MODEL):
+    return text_hash(json.dumps([PROMPT_VERSION, LLM_SCORING_MODE, EXPLANATION_MODE, model, profile_hash, text_hash(job_text)]))
+
+def explanation_cache_key(profile_hash, job_text, model=CHAT_MODEL):
+    return text_hash(json.dumps([PROMPT_VERSION, "explanation", model, profile_hash, text_hash(job_text)]))
+
+def build_embedding_text(internship):
+    return f"{internship['title']} at {internship['company']} located in {internship['location']}. {internship['description']}"
+
+def local_prefilter(user_profile_text, skills, internships, keep=CASCADE_LOCAL_KEEP):
+    # First cascade stage: sparse TF-IDF cosine between the profile (with the skills list
+    # repeated CASCADE_SKILL_WEIGHT times as a boost) and each listing, computed locally.
+    # Returns the indices of the best `keep` listings in their original order.
+    if not keep or len(internships) <= keep:
+        return list(range(len(internships)))
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+    vectorizer = HashingVectorizer(n_features=2 ** 20, ngram_range=(1, 2), stop_words="english", alternate_sign=False, norm=None)
+    query = user_profile_text + (" " + " ".join(skills)) * CASCADE_SKILL_WEIGHT
+    counts = vectorizer.transform([build_embedding_text(i) for i in internships] + [query])
+    tfidf = TfidfTransformer(sublinear_tf=True).fit_transform(counts)
+    scores = (tfidf[:-1] @ tfidf[-1].T).toarray().ravel()
+    return sorted(np.argpartition(-scores, keep - 1)[:keep].tolist())
+
+def build_job_text(internship):
+    description = truncate_to_tokens(internship['description'], JOB_DESCRIPTION_MAX_TOKENS)
+    return f"{internship['title']} at {internship['company']} located in {internship['location']}. Description: {description} Salary Range: ${internship['salary_min']}-${internship['salary_max']}"
+
+def chat(prompt, model=CHAT_MODEL, purpose="chat", **kwargs):
+    estimated_tokens = count_tokens(prompt, model) + kwargs.get("max_tokens", EXPLANATION_MAX_TOKENS)
+    response = call_with_retries(
+        get_openai_client().chat.completions.create,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        timeout=LLM_TIMEOUT_SECONDS,
+        estimated_tokens=estimated_tokens,
+        **kwargs
+    )
+    usage = getattr(response, "usage", None)
+    record_token_usage(purpose, usage)
+    if usage is not None:
+        get_api_scheduler().settle("openai", estimated_tokens, (usage.prompt_tokens or 0) + (usage.completion_tokens or 0))
+    return response.choices[0].message.content.strip()
+
+def chat_json(prompt, name, schema, model=CHAT_MODEL, purpose="chat", **kwargs):
+    reply = chat(prompt, model, purpose, response_format={
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": schema}
+    }, **kwargs)
+    return json.loads(reply)
+
+def parse_match(match, explain=True):
+    # Validate one {"score", "explanation"} object (just {"score"} when explain is False);
+    # raises ValueError if it doesn't fit the schema
+    score = match.get("score")
+    explanation = match.get("explanation") if explain else ""
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or not isinstance(explanation, str):
+        raise ValueError(f"Invalid match object: {match!r}")
+    return max(0.0, min(1.0, float(score))), explanation.strip() if explain else None
+
+def llm_match_score(user_profile_text, job_text):
+    # Returns None if the request or parsing fails, so the caller can fall back to a
+    # neutral score without memoizing it
+    prompt = f"""
+You are an internship matching AI given a USER PROFILE and JOB LISTING. Analyze and assign a MATCH_SCORE from 0 to 1 based on how suitable this listing is for the user. {MATCH_CRITERIA} Only output the score. {MATCH_SCORE_RULES}
+
+USER PROFILE:
+{user_profile_text}
+
+JOB LISTING:
+{job_text}
+
+MATCH_SCORE:
+"""
+    try:
+        reply = chat(prompt, purpose="score", max_tokens=SCORE_MAX_TOKENS)
+        score = float(reply.split()[0])
+    except Exception:
+        return None
+    return max(0.0, min(1.0, score))
+
+def explanation_prompt(user_profile_text, job_text):
+    return f"""
+You are a career advisor AI. {EXPLANATION_INSTRUCTIONS}
+
+USER PROFILE:
+{user_profile_text}
+
+JOB LISTING:
+{job_text}
+
+EXPLANATION:
+"""
+
+def llm_explanation(user_profile_text, job_text):
+    try:
+        return chat(explanation_prompt(user_profile_text, job_text), purpose="explanation", max_tokens=EXPLANATION_MAX_TOKENS)
+    except Exception:
+        return EXPLANATION_UNAVAILABLE
+
+def llm_score_and_explain(user_profile_text, job_text, explain=True):
+    # With explain=False only the score is requested and the explanation comes back as None;
+    # a failed request still returns EXPLANATION_UNAVAILABLE so it is never memoized
+    task = f"Then write an explanation for the user: {EXPLANATION_INSTRUCTIONS}" if explain else "Only output the score."
+    prompt = f"""
+You are an internship matching AI and career advisor given a USER PROFILE and JOB LISTING. Assign a MATCH_SCORE from 0 to 1 based on how suitable this listing is for the user. {MATCH_CRITERIA} {MATCH_SCORE_RULES} {task}
+
+USER PROFILE:
+{user_profile_text}
+
+JOB LISTING:
+{job_text}
+"""
+    try:
+        if explain:
+            return parse_match(chat_json(prompt, "match", MATCH_SCHEMA, purpose="match", max_tokens=SCORE_MAX_TOKENS + EXPLANATION_MAX_TOKENS))
+        return parse_match(chat_json(prompt, "match_score", SCORE_SCHEMA, purpose="score", max_tokens=SCORE_MAX_TOKENS), explain=False)
+    except Exception:
+        return 0.5, EXPLANATION_UNAVAILABLE
+
+def llm_score_batch(user_profile_text, job_texts, explain=True):
+    listings = "\n\n".join(f"LISTING {n}:\n{job_text}" for n, job_text in enumerate(job_texts, start=1))
+    task = f"Then write an explanation for the user for each listing: {EXPLANATION_INSTRUCTIONS}" if explain else "Only output the scores."
+    prompt = f"""
+You are an internship matching AI and career advisor given a USER PROFILE and {len(job_texts)} numbered JOB LISTINGS. Score each listing independently: assign a MATCH_SCORE from 0 to 1 based on how suitable it is for the user. {MATCH_CRITERIA} {MATCH_SCORE_RULES} {task} Return exactly one entry per listing, using its number as listing_id.
+
+USER PROFILE:
+{user_profile_text}
+
+JOB LISTINGS:
+{listings}
+"""
+    parsed = {}
+    try:
+        if explain:
+            matches = chat_json(prompt, "batch_match", BATCH_MATCH_SCHEMA, purpose="batch_match", max_tokens=(SCORE_MAX_TOKENS + EXPLANATION_MAX_TOKENS) * len(job_texts))["matches"]
+        else:
+            matches = chat_json(prompt, "batch_match_score", BATCH_SCORE_SCHEMA, purpose="batch_score", max_tokens=SCORE_MAX_TOKENS * len(job_texts))["matches"]
+        for match in matches:
+            try:
+                parsed[int(match["listing_id"])] = parse_match(match, explain)
+            except (KeyError, TypeError, ValueError):
+                continue
+    except Exception:
+        pass
+    # Any listing the batch reply dropped or garbled is re-scored on its own
+    return [parsed.get(n) or llm_score_and_explain(user_profile_text, job_text, explain) for n, job_text in enumerate(job_texts, start=1)]
+
+def iter_score_candidates(user_profile_text, job_texts):
+    # Yields (position, (score, explanation)) for every job text as soon as it is ready:
+    # memoized (profile, listing, model, prompt version) results first, then model replies
+    # in completion order
+    cache = get_match_cache()
+    profile_hash = normalized_profile_hash(user_profile_text)
+    keys = [match_cache_key(profile_hash, job_text) for job_text in job_texts]
+    missing = []
+    for n, key in enumerate(keys):
+        match = cache.get(key)
+        if match is None:
+            missing.append(n)
+        else:
+            yield n, match
+    metrics.count_cache("match", len(keys) - len(missing), len(missing))
+    for m, match in iter_scoring_requests(user_profile_text, [job_texts[n] for n in missing]):
+        if match[0] is None:
+            match = (0.5, match[1])  # Score request failed; default to neutral, uncached
+        elif match[1] != EXPLANATION_UNAVAILABLE:
+            cache.set(keys[missing[m]], match)
+        yield missing[m], match
+
+def score_candidates(user_profile_text, job_texts):
+    # Returns [(score, explanation)] in the same order as job_texts
+    matches = [None] * len(job_texts)
+    for n, match in iter_score_candidates(user_profile_text, job_texts):
+        matches[n] = match
+    return matches
+
+def iter_scoring_requests(user_profile_text, job_texts):
+    # Every request goes out at once, bounded by LLM_MAX_CONCURRENCY; yields
+    # (position, (score, explanation)) in completion order; explanation is None in lazy mode,
+    # and score is None when a separate-mode score request failed
+    if not job_texts:
+        return
+    explain = EXPLANATION_MODE == "eager"
+    executor = ThreadPoolExecutor(max_workers=max(1, LLM_MAX_CONCURRENCY))
+    try:
+        if LLM_SCORING_MODE == "separate" and not explain:
+            futures = {submit_in_context(executor, llm_match_score, user_profile_text, job_text): n for n, job_text in enumerate(job_texts)}
+            for future in as_completed(futures):
+                yield futures[future], (future.result(), None)
+        elif LLM_SCORING_MODE == "separate":
+            futures = {}
+            for n, job_text in enumerate(job_texts):
+                futures[submit_in_context(executor, llm_match_score, user_profile_text, job_text)] = (n, 0)
+                futures[submit_in_context(executor, llm_explanation, user_profile_text, job_text)] = (n, 1)
+            halves = {}
+            pending = [2] * len(job_texts)  # The score itself is None when its request failed
+            for future in as_completed(futures):
+                n, part = futures[future]
+                halves.setdefault(n, [None, None])[part] = future.result()
+                pending[n] -= 1
+                if not pending[n]:
+                    yield n, tuple(halves.pop(n))
+        elif LLM_SCORING_MODE == "batch":
+            size = max(1, LLM_BATCH_SIZE)
+            futures = {submit_in_context(executor, llm_score_batch, user_profile_text, job_texts[i:i + size], explain): i for i in range(0, len(job_texts), size)}
+            for future in as_completed(futures):
+                for offset, match in enumerate(future.result()):
+                    yield futures[future] + offset, match
+        else:
+            futures = {submit_in_context(executor, llm_score_and_explain, user_profile_text, job_text, explain): n for n, job_text in enumerate(job_texts)}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    finally:
+        # If the consumer stops early, queued requests are dropped instead of awaited
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def rank_candidates(user_profile_text, internships, index=None, skills=(), preferences=None):
+    # Cascade up to the LLM stage: structured hard filters -> near-duplicate collapse ->
+    # local TF-IDF prefilter -> embedding similarity. Returns [(similarity, listing)] for
+    # the best LLM_TOP_CANDIDATES listings.
+    if preferences is not None:
+        with metrics.stage("rule_filters"):
+            eligible, _ = score_listings(preferences, internships)
+            internships = [internship for internship, ok in zip(internships, eligible) if ok]
+    with metrics.stage("dedup"):
+        # Reposts of one role are collapsed before the costly stages; the copy kept is the
+        # first one fetched, with the other locations and URLs folded into it
+        internships = collapse_near_duplicates(internships)
+    with metrics.stage("tfidf_prefilter"):
+        internships = [internships[n] for n in local_prefilter(user_profile_text, skills, internships)]
+    job_texts = [build_embedding_text(i) for i in internships]
+
+    # One embedding pass for the profile and every listing, batched and sent concurrently
+    with metrics.stage("embeddings"):
+        embeddings = embed_texts([user_profile_text] + job_texts)
+    profile_embed = embeddings[0]
+    job_embeds = embeddings[1:]
+
+    similarities = job_embeds @ profile_embed
+    preliminary = []
+    for sim, internship in zip(similarities, internships):
+        preliminary.append((sim, internship))
+
+    # Pre-ingested listings closest to the profile compete with the live ones; their
+    # vectors come from the local index, so no job embedding calls are made for them
+    if index is not None and len(index) and index.model == EMBEDDING_MODEL:
+        with metrics.stage("index_search"):
+            index_scores, index_ids = index.search(profile_embed, k=LLM_TOP_CANDIDATES)
+            hits = index_ids[0] >= 0  # Unfilled slots are padded with -1
+            index_scores = index_scores[:, hits]
+            index_listings = index.get_listings(index_ids[0][hits])
+        eligible = score_listings(preferences, index_listings)[0] if preferences is not None else [True] * len(index_listings)
+        live_ids = {internship.get("id") for internship in internships}
+        for sim, listing, ok in zip(index_scores[0], index_listings, eligible):
+            if ok and listing.get("id") not in live_ids:
+                preliminary.append((sim, listing))
+        # Indexed copies of a live listing can carry a different id; keep the closer one
+        preliminary.sort(reverse=True, key=lambda x: x[0])
+        preliminary = [preliminary[n] for n in canonical_indices([listing for _, listing in preliminary])]
+    preliminary.sort(reverse=True, key=lambda x: x[0])
+    return preliminary[:LLM_TOP_CANDIDATES]
+
+def explain_and_cache(user_profile_text, job_text, key):
+    try:
+        explanation = llm_explanation(user_profile_text, job_text)
+        if explanation != EXPLANATION_UNAVAILABLE:
+            get_explanation_cache().set(key, explanation)
+        return explanation
+    finally:
+        with _explanation_lock:
+            _explanation_futures.pop(key, None)
+
+def request_explanation(user_profile_text, internship, priority=None):
+    # Returns a Future for the listing's explanation, memoized per (profile, listing)
+    job_text = build_job_text(internship)
+    key = explanation_cache_key(normalized_profile_hash(user_profile_text), job_text)
+    cached = get_explanation_cache().get(key)
+    metrics.count_cache("explanation", cached is not None, cached is None)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+    with _explanation_lock:
+        if key not in _explanation_futures:
+            _explanation_futures[key] = submit_in_context(get_explanation_executor(), explain_and_cache, user_profile_text, job_text, key, priority=priority)
+        return _explanation_futures[key]
+
+def get_explanation(user_profile_text, internship):
+    return request_explanation(user_profile_text, internship).result()
+
+def prefetch_explanations(user_profile_text, internships):
+    # Starts explanations in the background so they are ready when their cards are opened
+    for internship in internships:
+        request_explanation(user_profile_text, internship, priority=BACKGROUND)
+
+def remember_explanation(user_profile_text, internship, explanation):
+    key = explanation_cache_key(normalized_profile_hash(user_profile_text), build_job_text(internship))
+    get_explanation_cache().set(key, explanation)
+
+def stream_explanation(user_profile_text, internship):
+    # Yields the explanation piece by piece as the model writes it; a memoized or already
+    # requested explanation is yielded whole
+    job_text = build_job_text(internship)
+    key = explanation_cache_key(normalized_profile_hash(user_profile_text), job_text)
+    explanation = get_explanation_cache().get(key)
+    metrics.count_cache("explanation", explanation is not None, explanation is None)
+    if explanation is None:
+        with _explanation_lock:
+            pending = _explanation_futures.get(key)
+        if pending is not None:
+            explanation = pending.result()
+    if explanation is not None:
+        yield explanation
+        return
+
+    parts = []
+    prompt = explanation_prompt(user_profile_text, job_text)
+    try:
+        stream = call_with_retries(
+            get_openai_client().chat.completions.create,
+            model=CHAT_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=LLM_TIMEOUT_SECONDS,
+            estimated_tokens=count_tokens(prompt) + EXPLANATION_MAX_TOKENS,
+            max_tokens=EXPLANATION_MAX_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                record_token_usage("explanation", chunk.usage)
+            piece = chunk.choices[0].delta.content if chunk.choices else None
+            if piece:
+                parts.append(piece)
+                yield piece
+    except Exception:
+        if not parts:
+            yield EXPLANATION_UNAVAILABLE
+        return
+    get_explanation_cache().set(key, "".join(parts).strip())
+
+def iter_candidate_scores(user_profile_text, candidates):
+    # Yields (position, LLM score, explanation) for each (similarity, listing) candidate as
+    # soon as its LLM result is ready. In lazy mode the explanation is None unless one is
+    # already memoized for this profile and listing.
+    listings = [internship for _, internship in candidates]
+    scoring_texts = [build_job_text(internship) for internship in listings]
+    profile_hash = normalized_profile_hash(user_profile_text)
+    for n, (score, explanation) in iter_score_candidates(user_profile_text, scoring_texts):
+        if explanation is None or (explanation == EXPLANATION_UNAVAILABLE and EXPLANATION_MODE == "lazy"):
+            explanation = get_explanation_cache().get(explanation_cache_key(profile_hash, scoring_texts[n]))
+        elif explanation != EXPLANATION_UNAVAILABLE:
+            remember_explanation(user_profile_text, listings[n], explanation)
+        yield n, score, explanation
+
+def blend_rule_score(llm_score, rule_score):
+    return (1 - RULE_SCORE_WEIGHT) * llm_score + RULE_SCORE_WEIGHT * float(rule_score)
+
+def iter_match_results(user_profile_text, candidates, preferences=None):
+    # Yields (score, listing, explanation) as each candidate's LLM result arrives, with the
+    # rule score already blended in
+    listings = [internship for _, internship in candidates]
+    rule_scores = None
+    if preferences is not None and listings and RULE_SCORE_WEIGHT:
+        _, rule_scores = score_listings(preferences, listings)
+    for n, score, explanation in iter_candidate_scores(user_profile_text, candidates):
+        if rule_scores is not None:
+            score = blend_rule_score(score, rule_scores[n])
+        yield score, listings[n], explanation
+
+def rerank_matches(candidates, llm_scores, preferences=None):
+    # Re-applies only the structured stage to already scored candidates, so changed
+    # preferences re-rank without any API call. llm_scores holds each candidate's LLM score
+    # (None while it is still pending). Returns [(score, position)] for the scored candidates
+    # that pass the hard filters, best first; ties keep candidate order.
+    listings = [internship for _, internship in candidates]
+    eligible = [True] * len(listings)
+    rule_scores = None
+    if preferences is not None and listings:
+        eligible, rule_scores = score_listings(preferences, listings)
+        if not RULE_SCORE_WEIGHT:
+            rule_scores = None
+    ranked = []
+    for n, llm_score in enumerate(llm_scores):
+        if llm_score is None or not eligible[n]:
+            continue
+        ranked.append((llm_score if rule_scores is None else blend_rule_score(llm_score, rule_scores[n]), n))
+    ranked.sort(key=lambda x: (-x[0], x[1]))
+    return ranked
+
+def filters_loosened(listings, scored_preferences, preferences):
+    # True when preferences let through listings that the hard filters dropped before the
+    # LLM stage under scored_preferences. Those listings were never scored, so re-ranking
+    # can't bring them back; only a new Find Matches run can.
+    if not listings:
+        return False
+    eligible_now, _ = score_listings(preferences, listings)
+    eligible_then, _ = score_listings(scored_preferences, listings)
+    return bool((eligible_now & ~eligible_then).any())
+
+def hybrid_analyze_stream(user_profile_text, internships, index=None, skills=(), preferences=None):
+    candidates = rank_candidates(user_profile_text, internships, index, skills, preferences)
+    yield from iter_match_results(user_profile_text, candidates, preferences)
+
+def match_candidates(user_profile_text, candidates, preferences=None, explain_top=EXPLAIN_TOP_N):
+    # LLM stage for already ranked candidates; returns [(score, listing, explanation)] best
+    # first. Scoring and explanation are separate steps: only the best explain_top results
+    # missing an explanation get one written here; the rest stay None until asked for.
+    # Ties keep candidate order, so the result doesn't depend on which reply arrived first
+    position = {id(internship): n for n, (_, internship) in enumerate(candidates)}
+    results = list(metrics.timed_iter("llm_scoring", iter_match_results(user_profile_text, candidates, preferences)))
+    results.sort(key=lambda x: (-x[0], position[id(x[1])]))
+    with metrics.stage("explanations"):
+        pending = {n: request_explanation(user_profile_text, internship) for n, (_, internship, explanation) in enumerate(results[:explain_top]) if explanation is None}
+        for n, future in pending.items():
+            results[n] = (results[n][0], results[n][1], future.result())
+    return results
+
+def hybrid_analyze(user_profile_text, internships, index=None, skills=(), preferences=None, explain_top=EXPLAIN_TOP_N):
+    candidates = rank_candidates(user_profile_text, internships, index, skills, preferences)
+    return match_candidates(user_profile_text, candidates, preferences, explain_top)
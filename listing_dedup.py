@@ -0,0 +1,114 @@
+#Near-duplicate listing collapse for CareerNodes.
+
+#Each listing's title + company + description is shingled into word 3-grams and reduced to a
+#MinHash signature. Signatures are split into LSH bands, so only listings that share a band
+#bucket are ever compared; the work stays roughly linear in the number of listings. Buckets
+#are also keyed by the normalized title and company: different roles at one company often
+#share a boilerplate description, and the title alone barely moves the Jaccard estimate.
+#Members of a duplicate group are folded into the group's first listing in input order, which
+#keeps their other locations and URLs; callers that want the best ranked copy kept sort first.
+
+import os
+import re
+
+import numpy as np
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.8))
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32  # 32 bands x 4 rows: pairs above ~0.6 Jaccard almost always share a bucket
+SHINGLE_SIZE = 3
+
+# uint32 arithmetic wraps, so a * x + b below is computed mod 2^32 for free
+_rng = np.random.default_rng(2025)
+_HASH_A = _rng.integers(1, 2 ** 32, MINHASH_PERMUTATIONS, dtype=np.uint64).astype(np.uint32) | np.uint32(1)
+_HASH_B = _rng.integers(0, 2 ** 32, MINHASH_PERMUTATIONS, dtype=np.uint64).astype(np.uint32)
+_SHINGLE_MULTIPLIERS = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D], dtype=np.uint32)
+
+
+def shingle_hashes(listing):
+    # Words are hashed once (str hashes are stable within a process, which is all a single
+    # collapse needs); each 3-word shingle hash is a mix of its word hashes
+    text = f"{listing.get('title', '')} {listing.get('company', '')} {listing.get('description', '')}"
+    words = np.array(list(map(hash, re.findall(r"[a-z0-9]+", text.lower()))) or [0], dtype=np.int64).astype(np.uint32)
+    if len(words) < SHINGLE_SIZE:
+        return words
+    shingles = sum(words[i:len(words) - SHINGLE_SIZE + 1 + i] * _SHINGLE_MULTIPLIERS[i] for i in range(SHINGLE_SIZE))
+    return np.unique(shingles)
+
+
+def minhash_signatures(listings, chunk_size=256):
+    # (a * x + b) mod 2^32 for every permutation and shingle, minimised per listing.
+    # Listings are processed in chunks so the (permutations, shingles) matrix stays small.
+    signatures = np.empty((len(listings), MINHASH_PERMUTATIONS), dtype=np.uint32)
+    for start in range(0, len(listings), chunk_size):
+        hashes = [shingle_hashes(listing) for listing in listings[start:start + chunk_size]]
+        offsets = np.concatenate([[0], np.cumsum([len(h) for h in hashes])[:-1]])
+        values = _HASH_A[:, None] * np.concatenate(hashes)[None, :] + _HASH_B[:, None]
+        signatures[start:start + len(hashes)] = np.minimum.reduceat(values, offsets, axis=1).T
+    return signatures
+
+
+def identity_ids(listings):
+    # Small integer per distinct (normalized title, normalized company); only listings with
+    # the same id can be duplicates
+    def normalize(text):
+        return " ".join(re.findall(r"[a-z0-9]+", str(text or "").lower()))
+    identities = [f"{normalize(listing.get('title'))}|{normalize(listing.get('company'))}" for listing in listings]
+    return np.unique(identities, return_inverse=True)[1].ravel().astype(np.uint32)
+
+
+def find_root(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def duplicate_roots(listings, threshold=DEDUP_THRESHOLD):
+    # Returns, for every listing, the index of the first listing in its duplicate group
+    if len(listings) < 2:
+        return list(range(len(listings)))
+    signatures = minhash_signatures(listings)
+    identities = identity_ids(listings)[:, None]
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    parents = list(range(len(listings)))
+
+    for band in range(LSH_BANDS):
+        # Rows with the same title and company and an identical band land in one bucket; each
+        # row is checked against the bucket's first member only, so large buckets stay linear
+        keys = np.ascontiguousarray(np.hstack([identities, signatures[:, band * rows:(band + 1) * rows]])).view(np.dtype((np.void, (rows + 1) * signatures.itemsize))).ravel()
+        _, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        firsts = first_index[inverse.ravel()]
+        others = np.nonzero(firsts != np.arange(len(listings)))[0]
+        if not len(others):
+            continue
+        similar = (signatures[others] == signatures[firsts[others]]).mean(axis=1) >= threshold
+        for other, first in zip(others[similar], firsts[others[similar]]):
+            a, b = find_root(parents, int(first)), find_root(parents, int(other))
+            if a != b:
+                parents[max(a, b)] = min(a, b)
+
+    return [find_root(parents, i) for i in range(len(listings))]
+
+
+def canonical_indices(listings, threshold=DEDUP_THRESHOLD):
+    return [i for i, root in enumerate(duplicate_roots(listings, threshold)) if root == i]
+
+
+def collapse_near_duplicates(listings, threshold=DEDUP_THRESHOLD, roots=None):
+    # roots can be passed in when the caller already ran duplicate_roots on these listings
+    if roots is None:
+        roots = duplicate_roots(listings, threshold)
+    canonical = {}
+    for listing, root in zip(listings, roots):
+        if root not in canonical:
+            canonical[root] = dict(listing, alternate_locations=list(listing.get("alternate_locations", [])), alternate_urls=list(listing.get("alternate_urls", [])))
+            continue
+        kept = canonical[root]
+        for location in [listing.get("location")] + listing.get("alternate_locations", []):
+            if location and location != kept.get("location") and location not in kept["alternate_locations"]:
+                kept["alternate_locations"].append(location)
+        for url in [listing.get("redirect_url")] + listing.get("alternate_urls", []):
+            if url and url != kept.get("redirect_url") and url not in kept["alternate_urls"]:
+                kept["alternate_urls"].append(url)
+    return list(canonical.values())
@@ -0,0 +1,220 @@
+#Local vector index over a pre-ingested listing corpus for CareerNodes.
+
+#Index directory layout:
+#  meta.json                 model, dimension, row count and IVF settings
+#  vectors.f32               (count, dimension) L2-normalized float32 matrix, memory-mapped
+#  listings.jsonl            one normalized listing per row; listing_offsets.npy holds byte offsets
+#  ivf_*.npy, vectors_ivf.i8 inverted lists plus an int8 copy of the vectors stored list by list,
+#                            used by the approximate search mode
+
+#To build (or rebuild) an index from internships.json-style files and live Adzuna pulls:
+#python listing_index.py --json internships.json --adzuna internship --adzuna "data science internship" --pages 20
+
+import argparse
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from careernodes_core import EMBEDDING_MODEL, build_embedding_text, embed_texts, fetch_internships, normalize_listing, text_hash
+from listing_dedup import collapse_near_duplicates
+
+LISTING_INDEX_PATH = os.getenv("LISTING_INDEX_PATH", os.path.join(".cache", "listing_index"))
+LISTING_INDEX_MODE = os.getenv("LISTING_INDEX_MODE", "exact")  # "exact" or "ivf"
+LISTING_INDEX_NPROBE = int(os.getenv("LISTING_INDEX_NPROBE", 8))
+SEARCH_BLOCK_ROWS = 65536
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, ids, k):
+    # scores and ids are (queries, candidates); returns the best k per row, best first
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def quantize_rows(vectors):
+    # Symmetric per-row int8 quantization: vector ~= codes * scale
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def assign_lists(vectors, centroids):
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS])
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_ivf(vectors, nlist, iterations=10, sample_size=50000, seed=0):
+    # Spherical k-means on a sample; centroids stay unit length so dot products rank lists
+    rng = np.random.default_rng(seed)
+    sample_ids = np.sort(rng.choice(len(vectors), min(len(vectors), sample_size), replace=False))
+    sample = np.asarray(vectors[sample_ids])
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        filled = np.linalg.norm(sums, axis=1) > 0
+        centroids[filled] = normalize_rows(sums[filled])
+    return centroids
+
+
+def write_index(path, listings, vectors, model=EMBEDDING_MODEL, nlist=None):
+    os.makedirs(path, exist_ok=True)
+    vectors = normalize_rows(vectors)
+    vectors.tofile(os.path.join(path, "vectors.f32"))
+
+    offsets = []
+    with open(os.path.join(path, "listings.jsonl"), "wb") as f:
+        for listing in listings:
+            offsets.append(f.tell())
+            f.write(json.dumps(listing).encode("utf-8") + b"\n")
+    np.save(os.path.join(path, "listing_offsets.npy"), np.array(offsets, dtype=np.int64))
+
+    if nlist is None:
+        nlist = int(np.sqrt(len(vectors))) if len(vectors) >= 1000 else 0
+    if nlist:
+        centroids = train_ivf(vectors, nlist)
+        assignments = assign_lists(vectors, centroids)
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))]).astype(np.int64)
+        codes, scales = quantize_rows(vectors[order])
+        codes.tofile(os.path.join(path, "vectors_ivf.i8"))
+        np.save(os.path.join(path, "ivf_scales.npy"), scales)
+        np.save(os.path.join(path, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(path, "ivf_order.npy"), order)
+        np.save(os.path.join(path, "ivf_offsets.npy"), list_offsets)
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"model": model, "dimension": int(vectors.shape[1]), "count": len(vectors), "nlist": nlist}, f)
+
+
+class ListingIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.model = meta["model"]
+        self.count = meta["count"]
+        self.dimension = meta["dimension"]
+        self.nlist = meta.get("nlist", 0)
+        self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dimension))
+        self.listing_offsets = np.load(os.path.join(path, "listing_offsets.npy"))
+        if self.nlist:
+            self.ivf_codes = np.memmap(os.path.join(path, "vectors_ivf.i8"), dtype=np.int8, mode="r", shape=(self.count, self.dimension))
+            self.ivf_scales = np.load(os.path.join(path, "ivf_scales.npy"))
+            self.ivf_centroids = np.load(os.path.join(path, "ivf_centroids.npy"))
+            self.ivf_order = np.load(os.path.join(path, "ivf_order.npy"))
+            self.ivf_offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+
+    def __len__(self):
+        return self.count
+
+    def search(self, queries, k=20, mode=None, nprobe=LISTING_INDEX_NPROBE, rerank=4):
+        # queries is one vector or a (queries, dimension) matrix; returns (scores, row ids),
+        # each shaped (queries, k) and sorted best first. When a row has fewer than k hits
+        # (ivf mode probing small lists), the unused slots hold id -1 and score -inf.
+        queries = normalize_rows(np.atleast_2d(queries))
+        k = min(k, self.count)
+        if (mode or LISTING_INDEX_MODE) == "ivf" and self.nlist:
+            return self.search_ivf(queries, k, nprobe, rerank)
+        return self.search_exact(queries, k)
+
+    def search_exact(self, queries, k):
+        # Blocked matmul over the memory-mapped matrix, keeping a running top-k
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS])
+            scores = queries @ block.T
+            ids = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores, best_ids = top_k(np.hstack([best_scores, scores]), np.hstack([best_ids, ids]), k)
+        return best_scores, best_ids
+
+    def search_ivf(self, queries, k, nprobe, rerank):
+        # Probe the nprobe closest lists with int8 codes, then rerank the best k * rerank
+        # candidates against the exact float32 vectors
+        nprobe = min(nprobe, self.nlist)
+        probes = np.argpartition(-(queries @ self.ivf_centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, query in enumerate(queries):
+            spans = [(self.ivf_offsets[c], self.ivf_offsets[c + 1]) for c in probes[q]]
+            positions = np.concatenate([np.arange(a, b) for a, b in spans])
+            if not len(positions):
+                continue
+            codes = np.concatenate([np.asarray(self.ivf_codes[a:b]) for a, b in spans])
+            approx = (codes.astype(np.float32) @ query) * self.ivf_scales[positions]
+            keep = min(len(positions), k * rerank)
+            shortlist = np.sort(self.ivf_order[positions[np.argpartition(-approx, keep - 1)[:keep]]])
+            exact = np.asarray(self.vectors[shortlist]) @ query
+            scores, ids = top_k(exact[None, :], shortlist[None, :], k)
+            all_scores[q, :scores.shape[1]] = scores[0]
+            all_ids[q, :ids.shape[1]] = ids[0]
+        return all_scores, all_ids
+
+    def get_listings(self, ids):
+        listings = []
+        with open(os.path.join(self.path, "listings.jsonl"), "rb") as f:
+            for row in ids:
+                f.seek(int(self.listing_offsets[row]))
+                listings.append(json.loads(f.readline()))
+        return listings
+
+
+@lru_cache(maxsize=None)
+def load_default_index():
+    # The app runs fine without an index; it is only used once one has been built
+    if not os.path.exists(os.path.join(LISTING_INDEX_PATH, "meta.json")):
+        return None
+    return ListingIndex(LISTING_INDEX_PATH)
+
+
+def ingest(out, json_paths=(), adzuna_queries=(), location="", pages=10, nlist=None):
+    listings = []
+    for path in json_paths:
+        with open(path) as f:
+            listings += [normalize_listing(record) for record in json.load(f)]
+    if adzuna_queries:
+        jobs = fetch_internships(list(adzuna_queries), location, max_pages=pages, target_count=10 ** 9)
+        listings += [normalize_listing(job) for job in jobs]
+
+    # Records without an Adzuna id (e.g. internships.json) are identified by their text
+    unique = {}
+    for listing in listings:
+        text = build_embedding_text(listing)
+        listing["id"] = listing.get("id") or text_hash(text)[:16]
+        unique.setdefault(listing["id"], listing)
+    listings = collapse_near_duplicates(list(unique.values()))
+
+    vectors = embed_texts([build_embedding_text(listing) for listing in listings])
+    write_index(out, listings, vectors, EMBEDDING_MODEL, nlist)
+    return len(listings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the CareerNodes listing index.")
+    parser.add_argument("--out", default=LISTING_INDEX_PATH)
+    parser.add_argument("--json", action="append", default=[], help="internships.json-style file (repeatable)")
+    parser.add_argument("--adzuna", action="append", default=[], help="Adzuna 'what' query to pull (repeatable)")
+    parser.add_argument("--location", default="")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default sqrt(count), 0 disables)")
+    args = parser.parse_args()
+    count = ingest(args.out, args.json, args.adzuna, args.location, args.pages, args.nlist)
+    print(f"Indexed {count} listings into {args.out}")
@@ -0,0 +1,138 @@
+#Structured pre-filter and rule score for CareerNodes.
+
+#Listings are turned into a columnar table once, then every preference check runs as a
+#NumPy expression over all rows: hard filters drop clearly ineligible listings before any
+#API call, and the weighted rule score can be blended into the final ranking.
+
+import os
+import re
+
+import numpy as np
+
+# Comma-separated hard filters; "schedule" drops full-time/part-time mismatches and "salary"
+# drops listings paying below RULE_SALARY_HARD_RATIO of the user's minimum
+RULE_HARD_FILTERS = [f.strip() for f in os.getenv("RULE_HARD_FILTERS", "schedule,salary").split(",") if f.strip()]
+RULE_SALARY_HARD_RATIO = float(os.getenv("RULE_SALARY_HARD_RATIO", 0.5))
+RULE_WEIGHTS = {"salary": 0.25, "schedule": 0.2, "industry": 0.25, "location": 0.2, "work_type": 0.1}
+
+SCHEDULE_UNKNOWN, SCHEDULE_FULL_TIME, SCHEDULE_PART_TIME = 0, 1, 2
+SCHEDULE_CODES = {"full_time": SCHEDULE_FULL_TIME, "part_time": SCHEDULE_PART_TIME}
+
+# UI industry choices -> keywords found in Adzuna category labels / internships.json industries
+INDUSTRY_KEYWORDS = {
+    "Tech": ["it jobs", "tech", "engineering", "scientific", "software"],
+    "Finance": ["finance", "accounting", "banking"],
+    "Healthcare": ["healthcare", "nursing", "medical", "social work"],
+    "Education": ["teaching", "education"],
+    "Government": ["government", "public sector"],
+    "Nonprofit": ["charity", "voluntary", "nonprofit"],
+    "Consulting": ["consultancy", "consulting"],
+    "Manufacturing": ["manufacturing", "logistics", "trade & construction"],
+    "Media": ["pr, advertising", "marketing", "creative", "design", "media"],
+    "Energy": ["energy", "oil"],
+    "Legal": ["legal"],
+}
+INDUSTRIES = list(INDUSTRY_KEYWORDS)
+
+
+def schedule_code(value):
+    return SCHEDULE_CODES.get(re.sub(r"[\s-]+", "_", str(value or "").strip().lower()), SCHEDULE_UNKNOWN)
+
+
+def industry_bits(label):
+    # Bit n is set when the label matches INDUSTRIES[n]
+    label = str(label or "").lower()
+    bits = 0
+    for n, industry in enumerate(INDUSTRIES):
+        if any(keyword in label for keyword in INDUSTRY_KEYWORDS[industry]):
+            bits |= 1 << n
+    return bits
+
+
+def build_listing_table(listings):
+    text = [f"{l.get('title', '')} {l.get('location', '')} {l.get('description', '')}".lower() for l in listings]
+    return {
+        "salary_min": np.array([float(l.get("salary_min") or 0) for l in listings]),
+        "salary_max": np.array([float(l.get("salary_max") or 0) for l in listings]),
+        "schedule": np.array([schedule_code(l.get("schedule")) for l in listings], dtype=np.int8),
+        "industry": np.array([industry_bits(l.get("industry")) for l in listings], dtype=np.int64),
+        "industry_known": np.array([str(l.get("industry") or "Not specified") not in ("Not specified", "Unknown") for l in listings]),
+        "location": np.array([str(l.get("location") or "").lower() for l in listings], dtype=str),
+        "remote": np.array(["remote" in t for t in text]),
+        "hybrid": np.array(["hybrid" in t for t in text]),
+    }
+
+
+def location_tokens(location):
+    return [t for t in re.split(r"[^a-z]+", (location or "").lower()) if len(t) > 2]
+
+
+def evaluate_rules(preferences, table):
+    # Returns (eligible mask, rule score in [0, 1]) for every row; 0.5 means "no signal"
+    count = len(table["schedule"])
+    neutral = np.full(count, 0.5)
+    components = {}
+
+    # Salary: fraction of the user's minimum that the top of the listing's range covers
+    wanted_min = preferences.get("salary_min") or 0
+    listing_top = np.maximum(table["salary_min"], table["salary_max"])
+    known_salary = listing_top > 0
+    if wanted_min:
+        components["salary"] = np.where(known_salary, np.clip(listing_top / wanted_min, 0.0, 1.0), 0.5)
+    else:
+        components["salary"] = neutral
+
+    # Schedule: exact match, mismatch or unknown
+    wanted_schedule = schedule_code(preferences.get("schedule"))
+    if wanted_schedule != SCHEDULE_UNKNOWN:
+        components["schedule"] = np.where(table["schedule"] == SCHEDULE_UNKNOWN, 0.5, (table["schedule"] == wanted_schedule).astype(float))
+    else:
+        components["schedule"] = neutral
+
+    # Industry: any overlap between the listing's category bits and the chosen industries
+    chosen = preferences.get("industry") or []
+    wanted_bits = sum(1 << INDUSTRIES.index(i) for i in chosen if i in INDUSTRIES)
+    if chosen:
+        matched = (table["industry"] & wanted_bits) != 0
+        if "Other" in chosen:
+            matched |= table["industry"] == 0
+        components["industry"] = np.where(table["industry_known"], matched.astype(float), 0.5)
+    else:
+        components["industry"] = neutral
+
+    # Location: any meaningful token of the preferred location appears in the listing's location
+    tokens = location_tokens(preferences.get("location"))
+    if tokens:
+        in_location = np.zeros(count, dtype=bool)
+        for token in tokens:
+            in_location |= np.char.find(table["location"], token) >= 0
+        components["location"] = np.where(in_location | table["remote"], 1.0, 0.0)
+    else:
+        components["location"] = neutral
+
+    # Work type: keyword evidence of remote / hybrid work
+    wanted_type = (preferences.get("work_type") or "").lower()
+    if wanted_type == "remote":
+        components["work_type"] = np.where(table["remote"], 1.0, np.where(table["hybrid"], 0.5, 0.25))
+    elif wanted_type == "hybrid":
+        components["work_type"] = np.where(table["hybrid"], 1.0, 0.5)
+    elif wanted_type == "on-site":
+        components["work_type"] = np.where(table["remote"] & ~table["hybrid"], 0.0, 0.75)
+    else:
+        components["work_type"] = neutral
+
+    total_weight = sum(RULE_WEIGHTS.values())
+    scores = sum(RULE_WEIGHTS[name] * values for name, values in components.items()) / total_weight
+
+    eligible = np.ones(count, dtype=bool)
+    if "schedule" in RULE_HARD_FILTERS and wanted_schedule != SCHEDULE_UNKNOWN:
+        eligible &= (table["schedule"] == SCHEDULE_UNKNOWN) | (table["schedule"] == wanted_schedule)
+    if "salary" in RULE_HARD_FILTERS and wanted_min:
+        eligible &= ~known_salary | (listing_top >= wanted_min * RULE_SALARY_HARD_RATIO)
+    return eligible, scores
+
+
+def score_listings(preferences, listings):
+    if not listings:
+        return np.zeros(0, dtype=bool), np.zeros(0)
+    return evaluate_rules(preferences or {}, build_listing_table(listings))
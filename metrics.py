@@ -0,0 +1,234 @@
+#Per-stage instrumentation for CareerNodes.
+
+#A "run" (one Find Matches click, one streamed explanation, one batch profile, ...) collects
+#the wall time of each pipeline stage plus counters: API calls, retries and rate-limit waits,
+#prompt and completion tokens, and cache hits and misses. The run lives in a context
+#variable, so work submitted with api_scheduler.submit_in_context is counted too.
+
+#Collection is off unless METRICS_ENABLED is set or a caller starts a run itself (the app's
+#debug panel does). With no run active, stage() and count() return after a single context
+#variable lookup.
+
+#A finished run is logged as one JSON line on the "careernodes.metrics" logger and added to
+#process-wide totals. prometheus_text() renders those totals in the Prometheus text format;
+#when METRICS_PROMETHEUS_PATH is set they are also written there after every run (e.g. for
+#node_exporter's textfile collector).
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+METRICS_PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH")
+METRICS_PREFIX = "careernodes"
+
+logger = logging.getLogger("careernodes.metrics")
+
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+_NO_STAGE = nullcontext()
+
+
+class RunMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall_seconds = None
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> [calls, seconds], in the order stages first ran
+        self.counters = {}  # (counter, sorted label items) -> value
+        self.token = None  # Restores the enclosing run, if any, when this one finishes
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def add(self, key, value):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self.started
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "run": self.name,
+                "wall_seconds": self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self.started,
+                "stages": {stage: {"calls": calls, "seconds": seconds} for stage, (calls, seconds) in self.stages.items()},
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()],
+            }
+
+
+class _Stage:
+    __slots__ = ("run", "name", "started")
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.run.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _Totals:
+    # Process-wide sums over every finished run, for the Prometheus export
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = {}  # run name -> [count, seconds]
+        self.stages = {}  # stage -> [calls, seconds]
+        self.counters = {}
+
+    def add(self, run):
+        with run.lock:
+            run_stages = {stage: tuple(totals) for stage, totals in run.stages.items()}
+            run_counters = dict(run.counters)
+        with self.lock:
+            totals = self.runs.setdefault(run.name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += run.wall_seconds
+            for stage, (calls, seconds) in run_stages.items():
+                totals = self.stages.setdefault(stage, [0, 0.0])
+                totals[0] += calls
+                totals[1] += seconds
+            for key, value in run_counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+
+_totals = _Totals()
+
+
+def stage(name):
+    # with metrics.stage("embeddings"): ... adds the block's wall time to the active run
+    run = _current_run.get()
+    if run is None:
+        return _NO_STAGE
+    return _Stage(run, name)
+
+
+def timed(name):
+    # Decorator form of stage()
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(name, iterable):
+    # Counts only the time spent producing each item, not the caller's work between items
+    run = _current_run.get()
+    if run is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            run.add_time(name, time.perf_counter() - started)
+            return
+        run.add_time(name, time.perf_counter() - started)
+        yield item
+
+
+def count(name, value=1, **labels):
+    run = _current_run.get()
+    if run is not None and value:
+        run.add((name, tuple(sorted(labels.items()))), value)
+
+
+def count_cache(cache, hits, misses):
+    run = _current_run.get()
+    if run is not None:
+        run.add(("cache_hits", (("cache", cache),)), hits)
+        run.add(("cache_misses", (("cache", cache),)), misses)
+
+
+def start_run(name, enabled=None):
+    # Returns the new run, or None when collection is off. Runs nest: while this one is
+    # active it takes every measurement, and finishing it makes the enclosing run active again
+    if not (METRICS_ENABLED if enabled is None else enabled):
+        return None
+    run = RunMetrics(name)
+    run.token = _current_run.set(run)
+    return run
+
+
+def finish_run(run):
+    # Ends the run, publishes it and returns its snapshot
+    if _current_run.get() is run:
+        try:
+            _current_run.reset(run.token)
+        except ValueError:
+            _current_run.set(None)  # Finished from another context than the one it started in
+    run.finish()
+    _totals.add(run)
+    snapshot = run.snapshot()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(snapshot))
+    if METRICS_PROMETHEUS_PATH:
+        write_prometheus(METRICS_PROMETHEUS_PATH)
+    return snapshot
+
+
+@contextmanager
+def collect(name, enabled=None):
+    run = start_run(name, enabled)
+    if run is None:
+        yield None
+        return
+    try:
+        yield run
+    finally:
+        finish_run(run)
+
+
+def format_labels(labels):
+    escaped = ((key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}" if labels else ""
+
+
+def prometheus_text():
+    with _totals.lock:
+        runs = {name: list(totals) for name, totals in _totals.runs.items()}
+        stages = {name: list(totals) for name, totals in _totals.stages.items()}
+        counters = dict(_totals.counters)
+    lines = [
+        f"# TYPE {METRICS_PREFIX}_runs_total counter",
+        *(f'{METRICS_PREFIX}_runs_total{{run="{name}"}} {calls}' for name, (calls, _) in runs.items()),
+        f"# TYPE {METRICS_PREFIX}_run_seconds_total counter",
+        *(f'{METRICS_PREFIX}_run_seconds_total{{run="{name}"}} {seconds:.6f}' for name, (_, seconds) in runs.items()),
+        f"# TYPE {METRICS_PREFIX}_stage_calls_total counter",
+        *(f'{METRICS_PREFIX}_stage_calls_total{{stage="{name}"}} {calls}' for name, (calls, _) in stages.items()),
+        f"# TYPE {METRICS_PREFIX}_stage_seconds_total counter",
+        *(f'{METRICS_PREFIX}_stage_seconds_total{{stage="{name}"}} {seconds:.6f}' for name, (_, seconds) in stages.items()),
+    ]
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name}_total counter")
+        lines += [f"{METRICS_PREFIX}_{name}_total{format_labels(labels)} {value:g}" for (counter, labels), value in counters.items() if counter == name]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    # Written to a temporary file and renamed so a scraper never reads a partial file
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.write(prometheus_text())
+    os.replace(temporary, path)
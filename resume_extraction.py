@@ -0,0 +1,50 @@
+#Resume text extraction for CareerNodes.
+#Kept outside of CareerNodes.py so the page workers can be imported by a process pool.
+#PyPDF2 is imported on the first PDF, so sessions that never upload one don't load it.
+
+import io
+import os
+
+RESUME_MAX_BYTES = int(os.getenv("RESUME_MAX_BYTES", 5 * 1024 * 1024))
+RESUME_MAX_PAGES = int(os.getenv("RESUME_MAX_PAGES", 15))
+RESUME_MAX_CHARS = int(os.getenv("RESUME_MAX_CHARS", 40000))
+# PDFs with at least this many pages are split across the process pool
+RESUME_PARALLEL_MIN_PAGES = int(os.getenv("RESUME_PARALLEL_MIN_PAGES", 6))
+
+
+def extract_page_range(data, start, stop, max_chars=RESUME_MAX_CHARS):
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    text = ""
+    for page in reader.pages[start:stop]:
+        extracted = page.extract_text()
+        if extracted:
+            text += extracted + "\n"
+        if len(text) >= max_chars:
+            break  # Early cutoff: the rest of the range would be truncated anyway
+    return text
+
+
+def extract_text(name, data, executor=None, workers=1):
+    # Raises ValueError for uploads over RESUME_MAX_BYTES; otherwise returns at most
+    # RESUME_MAX_CHARS characters taken from the first RESUME_MAX_PAGES pages
+    if len(data) > RESUME_MAX_BYTES:
+        raise ValueError(f"Resume is larger than {RESUME_MAX_BYTES // (1024 * 1024)} MB.")
+
+    name = name.lower()
+    if name.endswith(".txt"):
+        return data.decode("utf-8", errors="ignore")[:RESUME_MAX_CHARS]
+    if not name.endswith(".pdf"):
+        return ""
+
+    import PyPDF2
+    page_count = min(len(PyPDF2.PdfReader(io.BytesIO(data)).pages), RESUME_MAX_PAGES)
+    if executor is None or workers <= 1 or page_count < RESUME_PARALLEL_MIN_PAGES:
+        return extract_page_range(data, 0, page_count)[:RESUME_MAX_CHARS]
+
+    # Contiguous page ranges, one per worker, joined back in page order
+    step = -(-page_count // workers)
+    starts = list(range(0, page_count, step))
+    stops = [min(start + step, page_count) for start in starts]
+    parts = executor.map(extract_page_range, [data] * len(starts), starts, stops)
+    return "".join(parts)[:RESUME_MAX_CHARS]